@@ -0,0 +1,350 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from GameServer import ROOT, load_bots
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+# load_bots puts the directories of both games on the path, so their modules import by name
+CONNECT4_BOTS = load_bots("connect4")
+TICTACTOE_BOTS = load_bots("tictactoe")
+
+from Bitboard import Bitboard, evaluate_bitboard
+from Connect4 import Connect4, evaluate_board
+from TicTacToe import Board
+import PerfectPlay
+
+CORPUS_PATH = os.path.join(ROOT, "Connect 4", "benchmark_corpus.json")
+
+# plies of the positions in each phase of the corpus
+PHASES = {"opening": (4, 10), "midgame": (12, 22), "endgame": (24, 34)}
+
+# allowed relative slowdown of timing metrics before they count as a regression
+TOLERANCE = 0.10
+
+
+def make_corpus(per_phase: int = 20, seed: int = 17, reference_depth: int = 11, path: str = CORPUS_PATH) -> dict:
+    """
+    Build the Connect 4 corpus: per_phase positions of each phase, taken from games
+    between a shallow PlayPro and random moves so they look like real play, with the
+    move and score of a reference_depth search without the opening book, the endgame
+    solver or the tablebase as the reference answer. The corpus is written to path and
+    returned.
+    """
+    rng = random.Random(seed)
+    player_bot = CONNECT4_BOTS.PlayPro(solver_cells=0)
+    player_bot.use_book = False
+    player_bot.tablebase = None
+    picked: Dict[str, List[Tuple[str, int]]] = {phase: [] for phase in PHASES}
+    seen = set()
+
+    while any(len(positions) < per_phase for positions in picked.values()):
+        game = Connect4()
+        player = 1
+        while game.check_win() is None and not game.check_draw():
+            for phase, (first, last) in PHASES.items():
+                if (first <= game.moves_played <= last and len(picked[phase]) < per_phase
+                        and game.serialize() not in seen and rng.random() < 0.3):
+                    seen.add(game.serialize())
+                    picked[phase].append((game.serialize(), player))
+            if rng.random() < 0.25:
+                column = rng.choice(game.get_available_moves())
+            else:
+                column = player_bot.minimax(game.board, 2, player)
+            game.drop_disc(column + 1, player)
+            player = 3 - player
+
+    corpus = {"reference_depth": reference_depth, "seed": seed, "positions": []}
+    for phase, positions in picked.items():
+        for serialized, player in positions:
+            bot = CONNECT4_BOTS.PlayPro(solver_cells=0)
+            bot.use_book = False
+            bot.tablebase = None
+            move = bot.minimax(parse_board(serialized), reference_depth, player)
+            corpus["positions"].append({"phase": phase, "board": serialized, "player": player,
+                                        "best_move": move, "score": bot.score})
+
+    with open(path, "w") as file:
+        json.dump(corpus, file, indent=2)
+    return corpus
+
+
+def load_corpus(path: str = CORPUS_PATH) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def parse_board(serialized: str) -> List[List[int]]:
+    """
+    Turn a Connect4.serialize string back into a board.
+    """
+    return [[int(cell) for cell in serialized[row * 7:row * 7 + 7]] for row in range(6)]
+
+
+def tictactoe_positions() -> List[Tuple[List[List[str]], str, set]]:
+    """
+    Every position of a Tic Tac Toe game where X moves first that is not over yet,
+    solved by plain negamax. Returns a list of (board, player to move, the moves that
+    keep the value of the position).
+    """
+    values: Dict[tuple, int] = {}
+
+    def winner_of(cells: list) -> bool:
+        return any(cells[a] != "." and cells[a] == cells[b] == cells[c] for a, b, c in PerfectPlay.LINES)
+
+    def value(cells: list, player: str) -> int:
+        key = tuple(cells)
+        if key not in values:
+            if winner_of(cells):
+                # the player who just moved has won
+                values[key] = -1
+            elif "." not in cells:
+                values[key] = 0
+            else:
+                best = -1
+                for index in range(9):
+                    if cells[index] == ".":
+                        cells[index] = player
+                        best = max(best, -value(cells, "O" if player == "X" else "X"))
+                        cells[index] = "."
+                values[key] = best
+        return values[key]
+
+    value(["."] * 9, "X")
+    positions = []
+    for key, position_value in values.items():
+        cells = list(key)
+        if winner_of(cells) or "." not in cells:
+            continue
+        player = "X" if cells.count("X") == cells.count("O") else "O"
+        good = set()
+        for index in range(9):
+            if cells[index] == ".":
+                cells[index] = player
+                if -value(cells, "O" if player == "X" else "X") == position_value:
+                    good.add((index // 3, index % 3))
+                cells[index] = "."
+        positions.append(([cells[row * 3:row * 3 + 3] for row in range(3)], player, good))
+    return positions
+
+
+def time_per_call(function: Callable, inputs: Sequence, repeat: int = 5, min_seconds: float = 0.2) -> float:
+    """
+    Call function on every input, over and over for at least min_seconds, and return
+    the nanoseconds per call of the fastest of repeat rounds.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            for value in inputs:
+                function(value)
+            calls += len(inputs)
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                break
+        best = min(best, elapsed / calls)
+    return best * 1e9
+
+
+def metric(value: float, unit: str, better: str, exact: bool = False) -> dict:
+    """
+    A measurement in the results. better is "higher" or "lower"; an exact metric, like
+    the share of correct moves, may not get worse at all, while timings may move by the
+    tolerance of the comparison.
+    """
+    return {"value": value, "unit": unit, "better": better, "exact": exact}
+
+
+def bench_connect4_search(corpus: dict, depth: int, per_phase: Optional[int] = None, repeat: int = 3) -> Tuple[dict, dict]:
+    """
+    Search the corpus positions of every phase with fixed depth PlayPro.minimax, a new
+    bot for every search and no opening book, endgame solver or tablebase, keeping the
+    fastest of repeat searches. Reports nodes per second, the average time to reach each
+    depth up to depth, and how often the move at depth agrees with the reference move.
+    Returns (metrics, details).
+    """
+    metrics, details = {}, {}
+    for phase in PHASES:
+        positions = [entry for entry in corpus["positions"] if entry["phase"] == phase][:per_phase]
+        seconds_at = [0.0] * (depth + 1)
+        nodes, agree = 0, 0
+        for entry in positions:
+            board = parse_board(entry["board"])
+            for current_depth in range(1, depth + 1):
+                best = float("inf")
+                for _ in range(repeat):
+                    bot = CONNECT4_BOTS.PlayPro(solver_cells=0)
+                    bot.use_book = False
+                    bot.tablebase = None
+                    start = time.perf_counter()
+                    move = bot.minimax(board, current_depth, entry["player"])
+                    best = min(best, time.perf_counter() - start)
+                seconds_at[current_depth] += best
+            nodes += bot.nodes
+            agree += move == entry["best_move"]
+
+        metrics[f"connect4.{phase}.nodes_per_second"] = metric(nodes / seconds_at[depth], "nodes/s", "higher")
+        metrics[f"connect4.{phase}.seconds_at_depth"] = metric(seconds_at[depth] / len(positions), "s", "lower")
+        metrics[f"connect4.{phase}.agreement"] = metric(agree / len(positions), "share", "higher", exact=True)
+        details[f"connect4.{phase}.time_to_depth"] = {current_depth: seconds_at[current_depth] / len(positions)
+                                                     for current_depth in range(1, depth + 1)}
+    return metrics, details
+
+
+def bench_tictactoe(positions: list) -> dict:
+    """
+    Time PlayProBot's table lookups and PlayMNKBot's full search on every position,
+    and check both against the solved values.
+    """
+    metrics = {}
+    lookup_bot = TICTACTOE_BOTS.PlayProBot()
+    agree = sum(lookup_bot.minimax(board, 9, player) in good for board, player, good in positions)
+    metrics["tictactoe.lookup.agreement"] = metric(agree / len(positions), "share", "higher", exact=True)
+    metrics["tictactoe.lookup.ns"] = metric(
+        time_per_call(lambda position: lookup_bot.minimax(position[0], 9, position[1]), positions), "ns", "lower")
+
+    nodes, seconds, agree = 0, 0.0, 0
+    for board, player, good in positions:
+        bot = TICTACTOE_BOTS.PlayMNKBot(3, 3, 3, 9, None)
+        start = time.perf_counter()
+        move = bot.minimax(board, 9, player)
+        seconds += time.perf_counter() - start
+        nodes += bot.nodes
+        agree += move in good
+    metrics["tictactoe.search.nodes_per_second"] = metric(nodes / seconds, "nodes/s", "higher")
+    metrics["tictactoe.search.agreement"] = metric(agree / len(positions), "share", "higher", exact=True)
+    return metrics
+
+
+def bench_functions(corpus: dict, ttt_positions: list) -> dict:
+    """
+    Nanoseconds per call of the functions the searches spend their time in, over the
+    corpus positions.
+    """
+    boards = [parse_board(entry["board"]) for entry in corpus["positions"]]
+    games = [Connect4(board) for board in boards]
+    bitboards = [Bitboard(board) for board in boards]
+    columns = [bitboard.get_available_moves()[0] for bitboard in bitboards]
+    evaluators = [game.track_evaluation() for game in games]
+    ttt_boards = [Board(board) for board, _, _ in ttt_positions]
+
+    def play_undo(index: int):
+        bitboards[index].play(columns[index], 1)
+        bitboards[index].undo()
+
+    timings = {
+        "evaluate_board": time_per_call(lambda game: evaluate_board(game, 1), games),
+        "connect4_check_win": time_per_call(Connect4.check_win, games),
+        "connect4_find_winner": time_per_call(Connect4.find_winner, games),
+        "evaluate_bitboard": time_per_call(lambda bitboard: evaluate_bitboard(bitboard, 1), bitboards),
+        "bitboard_play_undo": time_per_call(play_undo, range(len(bitboards))),
+        "incremental_evaluate": time_per_call(lambda evaluator: evaluator.evaluate(1), evaluators),
+        "tictactoe_find_winner": time_per_call(Board.find_winner, ttt_boards),
+        "tictactoe_table_lookup": time_per_call(PerfectPlay.lookup, [board for board, _, _ in ttt_positions]),
+    }
+    try:
+        import BatchEval
+    except ImportError:
+        # numpy is optional, the batch evaluator and the playouts are only timed where it is installed
+        pass
+    else:
+        batch = BatchEval.to_array(boards)
+        timings["batch_evaluate"] = time_per_call(lambda array: BatchEval.evaluate_batch(array, 1), [batch]) / len(boards)
+
+        import MCTS
+        import numpy as np
+        # 32 random games from every position, played all at once
+        current = np.repeat(np.array([bitboard.boards[entry["player"]] for bitboard, entry in zip(bitboards, corpus["positions"])],
+                                     dtype=np.uint64), 32)
+        mask = np.repeat(np.array([bitboard.boards[1] | bitboard.boards[2] for bitboard in bitboards], dtype=np.uint64), 32)
+        rng = np.random.default_rng(0)
+        timings["mcts_playout"] = time_per_call(lambda _: MCTS.random_playouts(current, mask, rng), [None]) / len(current)
+
+    return {f"functions.{name}.ns": metric(value, "ns", "lower") for name, value in timings.items()}
+
+
+def run_benchmarks(depth: int = 7, quick: bool = False, corpus_path: str = CORPUS_PATH) -> dict:
+    """
+    Run the whole suite. quick searches 5 positions per phase to depth 5 and only a
+    tenth of the Tic Tac Toe positions, for a fast check while working; its numbers
+    are not comparable to a full run.
+    """
+    corpus = load_corpus(corpus_path)
+    ttt_positions = tictactoe_positions()
+    if quick:
+        depth = min(depth, 5)
+        ttt_positions = ttt_positions[::10]
+
+    metrics, details = bench_connect4_search(corpus, depth, 5 if quick else None)
+    metrics.update(bench_tictactoe(ttt_positions))
+    metrics.update(bench_functions(corpus, ttt_positions))
+    meta = {
+        "depth": depth,
+        "quick": quick,
+        "connect4_positions": len(corpus["positions"]),
+        "tictactoe_positions": len(ttt_positions),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    return {"meta": meta, "metrics": metrics, "details": details}
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE) -> List[str]:
+    """
+    Print every metric next to its value in baseline and return the names of the ones
+    that got worse: exact metrics by any amount, the others by more than tolerance.
+    """
+    for key in ("depth", "quick"):
+        if results["meta"][key] != baseline["meta"][key]:
+            raise ValueError(f"the baseline was run with {key}={baseline['meta'][key]}, not {results['meta'][key]}")
+
+    regressions = []
+    for name, current in results["metrics"].items():
+        old = baseline["metrics"].get(name)
+        if old is None:
+            print(f"{name:45} {current['value']:14.6g} {current['unit']:8} new")
+            continue
+        value, old_value = current["value"], old["value"]
+        change = (value - old_value) / old_value if old_value else 0.0
+        allowed = 0.0 if current["exact"] else tolerance
+        worse = change < -allowed if current["better"] == "higher" else change > allowed
+        if worse:
+            regressions.append(name)
+        print(f"{name:45} {value:14.6g} {current['unit']:8} {change * 100:+7.1f}%{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Connect 4 and Tic Tac Toe searches on a fixed set of positions.")
+    parser.add_argument("--depth", type=int, default=7, help="depth of the Connect 4 searches")
+    parser.add_argument("--quick", action="store_true", help="a smaller run for a fast check")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown of timings, 0.1 is 10%%")
+    parser.add_argument("--make-corpus", action="store_true", help="build the Connect 4 corpus again, this takes a while")
+    args = parser.parse_args()
+
+    if args.make_corpus:
+        make_corpus()
+        print(f"Wrote {CORPUS_PATH}")
+    results = run_benchmarks(args.depth, args.quick)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        for name, current in results["metrics"].items():
+            print(f"{name:45} {current['value']:14.6g} {current['unit']}")
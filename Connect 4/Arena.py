@@ -0,0 +1,298 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from BookBuilder import load_bots
+from MoveOrdering import CenterOrderer, KillerHistoryOrderer, MoveOrderer
+import argparse
+import json
+import math
+import os
+import random
+import time
+
+ORDERERS = {"killer": KillerHistoryOrderer, "center": CenterOrderer, "plain": MoveOrderer}
+
+# z for 95% confidence intervals
+Z = 1.96
+
+# the bots of each worker process, by (spec, player), created on their first game
+_worker_players: Dict[Tuple[str, int], tuple] = {}
+
+
+def parse_player(spec: str) -> dict:
+    """
+    Read a player spec: "random" for PlayStupidBot, "pro" for PlayPro or "mcts" for
+    PlayMCTS, with options after a colon, for example "pro:depth=5",
+    "pro:time=0.1,algorithm=pvs", "pro:depth=7,order=center,book=no,tt=32,solve=0" or
+    "mcts:playouts=50000,c=1.0". A pro searches to depth 7 unless a depth or a time per
+    move is given, and solves positions with at most solve (16) empty cells to the end.
+    An mcts plays 20000 random games per move unless a time per move is given.
+    """
+    name, _, options = spec.partition(":")
+    if name not in ("random", "pro", "mcts"):
+        raise ValueError(f"unknown player {name!r}, expected random, pro or mcts")
+    if name == "mcts":
+        settings = {"name": name, "playouts": 20000, "time": None, "c": None}
+    else:
+        settings = {"name": name, "depth": 7, "time": None, "algorithm": "minimax", "order": "killer", "book": True,
+                    "tt": 16.0, "solve": 16}
+
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        if key not in settings or key == "name" or name == "random":
+            raise ValueError(f"unknown option {key!r} for player {name}")
+        if key in ("depth", "solve", "playouts"):
+            settings[key] = int(value)
+        elif key in ("time", "tt", "c"):
+            settings[key] = float(value)
+        elif key == "book":
+            settings[key] = value.lower() not in ("no", "false", "0", "off")
+        elif key == "order" and value not in ORDERERS:
+            raise ValueError(f"unknown move ordering {value!r}, expected one of {', '.join(ORDERERS)}")
+        else:
+            settings[key] = value
+    return settings
+
+
+def make_player(spec: str):
+    """
+    Create the bot a spec describes. Returns (bot, settings).
+    """
+    settings = parse_player(spec)
+    bots = load_bots()
+    if settings["name"] == "random":
+        return bots.PlayStupidBot(), settings
+    if settings["name"] == "mcts":
+        return bots.PlayMCTS(settings["playouts"], settings["time"], settings["c"]), settings
+
+    bot = bots.PlayPro(settings["tt"], settings["time"], ORDERERS[settings["order"]](), settings["algorithm"], settings["solve"])
+    bot.use_book = settings["book"]
+    return bot, settings
+
+
+def choose_move(bot, settings: dict) -> int:
+    """
+    Ask a bot for its move in the position on its board, searching as its settings say.
+    """
+    if settings["name"] == "pro" and settings["time"] is None:
+        return bot.minimax(bot.board.board, settings["depth"], bot.to_move())
+    return bot.best_move(settings["time"])
+
+
+def play_game(index: int, spec_a: str, spec_b: str, seed: int = 0, opening: int = 2) -> dict:
+    """
+    Play game number index between the players spec_a and spec_b without any input or
+    output. Even games have a moving first and odd games b, and every pair of games
+    starts with the same opening random moves, so both players get each opening with
+    both colors. Returns the record of the game, with the result from a's side.
+    """
+    opening_rng = random.Random(seed * 1000003 + index // 2)
+    # for the random player
+    random.seed(seed * 1000003 + index)
+
+    a_player = 1 if index % 2 == 0 else 2
+    specs = {a_player: spec_a, 3 - a_player: spec_b}
+    players = {}
+    for player, spec in specs.items():
+        if (spec, player) not in _worker_players:
+            _worker_players[spec, player] = make_player(spec)
+        bot, settings = _worker_players[spec, player]
+        bot.new_game()
+        if hasattr(bot, "tt"):
+            bot.tt.clear()
+            bot.solver.table.clear()
+        if hasattr(bot, "mcts"):
+            bot.mcts.reseed(seed * 1000003 + index)
+        players[player] = (bot, settings)
+
+    def play(column: int):
+        for bot, _ in players.values():
+            bot.apply_move(column)
+
+    board = players[1][0]
+    opening_moves = []
+    while len(opening_moves) < opening and not board.game_over():
+        column = opening_rng.choice(board.board.get_available_moves())
+        play(column)
+        opening_moves.append(column)
+
+    seconds = {1: 0.0, 2: 0.0}
+    moves = {1: 0, 2: 0}
+    while not board.game_over():
+        player = board.to_move()
+        bot, settings = players[player]
+        start = time.perf_counter()
+        column = choose_move(bot, settings)
+        seconds[player] += time.perf_counter() - start
+        moves[player] += 1
+        play(column)
+
+    winner = board.board.check_win() or 0
+    result = "draw" if winner == 0 else ("win" if winner == a_player else "loss")
+    return {
+        "game": index,
+        "a_player": a_player,
+        "winner": winner,
+        "result": result,
+        "plies": board.board.moves_played,
+        "opening": opening_moves,
+        "a_seconds": seconds[a_player],
+        "a_moves": moves[a_player],
+        "b_seconds": seconds[3 - a_player],
+        "b_moves": moves[3 - a_player],
+    }
+
+
+def wilson(count: float, total: int) -> Tuple[float, float]:
+    """
+    The 95% Wilson score interval of a rate of count out of total.
+    """
+    if total == 0:
+        return 0.0, 1.0
+    center = (count + Z * Z / 2) / (total + Z * Z)
+    half = Z * math.sqrt(count * (total - count) / total + Z * Z / 4) / (total + Z * Z)
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+def elo(score: float) -> float:
+    """
+    The rating difference that gives an expected score, infinite for 0 and 1.
+    """
+    if score <= 0:
+        return float("-inf")
+    if score >= 1:
+        return float("inf")
+    return -400 * math.log10(1 / score - 1)
+
+
+def summarize(records: List[dict]) -> dict:
+    """
+    Add up game records into wins, draws and losses of player a with 95% confidence
+    intervals, its score (a draw counting half) with its interval in score and in
+    Elo, and the average time per move of both players.
+    """
+    games = len(records)
+    counts = {result: sum(record["result"] == result for record in records) for result in ("win", "draw", "loss")}
+    points = counts["win"] + counts["draw"] / 2
+    score = points / games if games else 0.5
+    # counting a draw as half a win, which keeps the interval sensible at 0% and 100%
+    score_low, score_high = wilson(points, games)
+
+    summary = {"games": games, "score": score, "score_ci": (score_low, score_high),
+               "elo": elo(score), "elo_ci": (elo(score_low), elo(score_high))}
+    for result, count in counts.items():
+        summary[result] = count
+        summary[result + "_ci"] = wilson(count, games)
+    for side in ("a", "b"):
+        moves = sum(record[side + "_moves"] for record in records)
+        summary[side + "_move_seconds"] = sum(record[side + "_seconds"] for record in records) / moves if moves else 0.0
+    return summary
+
+
+def read_results(path: str) -> Tuple[Optional[dict], List[dict]]:
+    """
+    Read a results file: its header line and the records of the games finished so far.
+    A line cut short by an interrupted run is dropped from the file.
+    """
+    if not os.path.exists(path):
+        return None, []
+    header, records, good_bytes = None, [], 0
+    with open(path, "rb") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            good_bytes += len(line)
+            if header is None:
+                header = entry
+            else:
+                records.append(entry)
+    os.truncate(path, good_bytes)
+    return header, records
+
+
+def run_arena(spec_a: str, spec_b: str, games: int, workers: Optional[int] = None, output: str = "arena.jsonl",
+              seed: int = 0, opening: int = 2, report_every: int = 100) -> dict:
+    """
+    Play games between two players across a pool of worker processes. Every finished
+    game is appended to output as a line of JSON, after a header line that describes
+    the match, so a run that is stopped continues where it left off when it is started
+    again with the same players. Returns the summary of all games in the file, with the
+    games per second of this run.
+    """
+    for spec in (spec_a, spec_b):
+        parse_player(spec)
+    header = {"a": spec_a, "b": spec_b, "seed": seed, "opening": opening}
+    old_header, records = read_results(output)
+    if old_header is not None and old_header != header:
+        raise ValueError(f"{output} holds a different match: {old_header}")
+
+    done = {record["game"] for record in records}
+    todo = [index for index in range(games) if index not in done]
+    print(f"{len(done)} games already played, {len(todo)} to go")
+
+    start = time.perf_counter()
+    played = 0
+    executor = ProcessPoolExecutor(workers)
+    try:
+        with open(output, "a") as file:
+            if old_header is None:
+                file.write(json.dumps(header) + "\n")
+            futures = [executor.submit(play_game, index, spec_a, spec_b, seed, opening) for index in todo]
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                file.write(json.dumps(record) + "\n")
+                file.flush()
+                played += 1
+                if report_every and (played % report_every == 0 or played == len(todo)):
+                    print(f"{len(records)}/{games} games, " + format_summary(summarize(records)).splitlines()[0])
+    finally:
+        # on an interruption, do not wait for the games that were still queued
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    summary = summarize(records)
+    seconds = time.perf_counter() - start
+    summary["games_per_second"] = played / seconds if seconds > 0 else 0.0
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    """
+    Describe a summary in a few lines of text.
+    """
+    def percent(interval: Tuple[float, float]) -> str:
+        return f"{interval[0] * 100:.1f}-{interval[1] * 100:.1f}%"
+
+    lines = [
+        f"a scores {summary['score'] * 100:.1f}% ({percent(summary['score_ci'])}), "
+        f"Elo {summary['elo']:+.0f} ({summary['elo_ci'][0]:+.0f} to {summary['elo_ci'][1]:+.0f})",
+        f"a wins {summary['win']} ({percent(summary['win_ci'])}), draws {summary['draw']} ({percent(summary['draw_ci'])}), "
+        f"losses {summary['loss']} ({percent(summary['loss_ci'])}) of {summary['games']}",
+        f"average move: a {summary['a_move_seconds'] * 1000:.1f} ms, b {summary['b_move_seconds'] * 1000:.1f} ms",
+    ]
+    if "games_per_second" in summary:
+        lines.append(f"{summary['games_per_second']:.2f} games per second")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play two Connect 4 bots against each other.")
+    parser.add_argument("a", help='first player, e.g. "pro:depth=7", "pro:time=0.1,algorithm=pvs" or "random"')
+    parser.add_argument("b", help="second player")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--output", default="arena.jsonl", help="file the results are streamed to")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--opening", type=int, default=2, help="random moves at the start of every pair of games")
+    args = parser.parse_args()
+
+    try:
+        summary = run_arena(args.a, args.b, args.games, args.workers, args.output, args.seed, args.opening)
+    except KeyboardInterrupt:
+        print(f"Interrupted, run the same command again to continue from {args.output}")
+    else:
+        print(format_summary(summary))
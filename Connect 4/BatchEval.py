@@ -0,0 +1,275 @@
+from __future__ import annotations
+from typing import Iterable, List, Tuple, Union
+from Connect4 import Connect4, CENTER_WEIGHTS, EVAL_WINDOWS, WINDOW_SCORES
+import numpy as np
+
+# positions are scored this many at a time, which keeps the temporary arrays in the CPU cache
+CHUNK = 8192
+
+# the batch bitboards have a byte per row, bit row * 8 + col in the order of Connect4.board,
+# so the last bit of every row is always empty and shifts can not wrap around to the next row
+ROW_BITS = 8
+# shifts to the next cell to the right, down, down to the right and down to the left
+STEPS = (1, 8, 9, 7)
+
+
+def _cell_bit(row: int, col: int) -> int:
+    return row * ROW_BITS + col
+
+
+def _window_masks(windows: List[List[Tuple[int, int]]]) -> List[Tuple[np.uint64, np.uint64]]:
+    """
+    Group windows by direction. Returns (step, mask) pairs, where mask has the lowest
+    bit of every window that goes in the direction of step.
+    """
+    masks = {}
+    for window in windows:
+        bits = sorted(_cell_bit(row, col) for row, col in window)
+        step = bits[1] - bits[0]
+        masks[step] = masks.get(step, 0) | 1 << bits[0]
+    return [(np.uint64(step), np.uint64(mask)) for step, mask in sorted(masks.items())]
+
+
+# the windows evaluate_board scores, by direction
+EVAL_MASKS = _window_masks(EVAL_WINDOWS)
+
+# the columns of every center weight but 0, CENTER_MASKS[weight] for weight 1 to 3
+CENTER_MASKS = {weight: np.uint64(sum(1 << _cell_bit(row, col) for row in range(6) for col in range(7) if CENTER_WEIGHTS[col] == weight))
+                for weight in set(CENTER_WEIGHTS) if weight}
+
+# the score of a window holding 1, 2 or 3 discs of a player and none of the other
+OPEN_WINDOW_SCORES = {count: WINDOW_SCORES[count][0] for count in (1, 2, 3)}
+
+# WINDOW_SCORE_TABLE[mine * 5 + theirs] is WINDOW_SCORES[mine][theirs]
+WINDOW_SCORE_TABLE = np.array(WINDOW_SCORES, dtype=np.int32).ravel()
+CENTER_WEIGHT_ROW = np.array(CENTER_WEIGHTS, dtype=np.int32)
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _BYTE_COUNTS = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+    def _popcount(values: np.ndarray) -> np.ndarray:
+        return _BYTE_COUNTS[values.view(np.uint8).reshape(len(values), 8)].sum(axis=1)
+
+
+def to_array(boards: Iterable[Union[Connect4, list]]) -> np.ndarray:
+    """
+    Stack Connect4 games or Connect4.board grids into an (N, 6, 7) int8 array.
+    """
+    return np.array([board.board if isinstance(board, Connect4) else board for board in boards], dtype=np.int8).reshape(-1, 6, 7)
+
+
+def _as_batch(boards) -> np.ndarray:
+    boards = np.asarray(boards, dtype=np.int8)
+    if boards.ndim == 2:
+        boards = boards[np.newaxis]
+    if boards.ndim != 3 or boards.shape[1:] != (6, 7):
+        raise ValueError(f"expected an (N, 6, 7) array of boards, got shape {boards.shape}")
+    return boards
+
+
+def window_counts(discs: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Count the discs in every four-cell window of a batch of 0/1 masks of shape (6, 7, N),
+    the positions along the last axis so every operation runs over N values at once,
+    by adding up the mask shifted by 0 to 3 cells in each direction. Returns the counts
+    of the horizontal windows (6, 4, N) and the vertical ones (3, 7, N), both indexed by
+    their first cell, of the windows going up to the right (3, 4, N) indexed by their
+    bottom cell minus 3 rows, and of the ones going down to the right (3, 4, N) indexed
+    by their top cell.
+    """
+    horizontal = discs[:, 0:4] + discs[:, 1:5] + discs[:, 2:6] + discs[:, 3:7]
+    vertical = discs[0:3] + discs[1:4] + discs[2:5] + discs[3:6]
+    rising = discs[3:6, 0:4] + discs[2:5, 1:5] + discs[1:4, 2:6] + discs[0:3, 3:7]
+    falling = discs[0:3, 0:4] + discs[1:4, 1:5] + discs[2:5, 2:6] + discs[3:6, 3:7]
+    return horizontal, vertical, rising, falling
+
+
+def _scan_order(discs: np.ndarray) -> np.ndarray:
+    """
+    The counts of every window, (69, N), in the order Connect4.find_winner scans them.
+    """
+    horizontal, vertical, rising, falling = window_counts(discs)
+    count = discs.shape[-1]
+    return np.concatenate((horizontal.reshape(-1, count), vertical.transpose(1, 0, 2).reshape(-1, count),
+                           rising.reshape(-1, count), falling.reshape(-1, count)))
+
+
+def _evaluation_order(discs: np.ndarray) -> np.ndarray:
+    """
+    The counts of the windows evaluate_board looks at, (56, N), in the order of
+    Connect4.EVAL_WINDOWS: rows only from the first three columns and columns only
+    from the first two rows.
+    """
+    horizontal, vertical, rising, falling = window_counts(discs)
+    count = discs.shape[-1]
+    return np.concatenate((horizontal[:, :3].reshape(-1, count), vertical[:2].transpose(1, 0, 2).reshape(-1, count),
+                           rising.reshape(-1, count), falling.reshape(-1, count)))
+
+
+def _first_four(counts_1: np.ndarray, counts_2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find the first window in which one of the players has four discs. Returns whether
+    there is one and the player (1 or 2) it belongs to, for every position.
+    """
+    fours_1 = counts_1 == 4
+    fours = fours_1 | (counts_2 == 4)
+    found = fours.any(axis=0)
+    owner = np.zeros(len(found), dtype=np.int8)
+    if found.any():
+        positions = np.flatnonzero(found)
+        first = fours[:, positions].argmax(axis=0)
+        owner[positions] = np.where(fours_1[first, positions], 1, 2)
+    return found, owner
+
+
+def _evaluate_by_windows(boards: np.ndarray, players: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Work out the winners, draws and scores from the disc counts of every window. This
+    finds which four in a row comes first in the scan orders of the scalar functions,
+    so it is used for the positions where both players have one.
+    """
+    cells = np.ascontiguousarray(boards.transpose(1, 2, 0))
+    discs_1 = (cells == 1).view(np.uint8)
+    discs_2 = (cells == 2).view(np.uint8)
+
+    found, owner = _first_four(_scan_order(discs_1), _scan_order(discs_2))
+    winners = owner
+    draws = ~found & ((cells != 0).sum(axis=(0, 1)) == 42)
+
+    counts_1, counts_2 = _evaluation_order(discs_1), _evaluation_order(discs_2)
+    # the window part is the same for both players with the sign flipped, so score it for player 1
+    window_score = np.take(WINDOW_SCORE_TABLE, counts_1 * 5 + counts_2).sum(axis=0)
+    # the center part always favours player 1, whoever the score is for
+    center = CENTER_WEIGHT_ROW @ (discs_1.sum(axis=0, dtype=np.int32) - discs_2.sum(axis=0, dtype=np.int32))
+    scores = center + np.where(players == 1, window_score, -window_score)
+
+    # evaluate_board returns on the first completed window it visits
+    found, owner = _first_four(counts_1, counts_2)
+    scores = np.where(found, np.where(owner == players, 1000, -1000), scores)
+    return winners, draws, scores
+
+
+def to_bitboards(boards: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pack an (N, 6, 7) array of boards into two arrays of N uint64 bitboards, the discs
+    of player 1 and of player 2, in the layout described at ROW_BITS.
+    """
+    # pad every row with the empty eighth cell, so packbits turns each row into a byte
+    cells = np.zeros((len(boards), 6, ROW_BITS), dtype=np.int8)
+    cells[:, :, :7] = boards
+    cells = cells.reshape(len(boards), 6 * ROW_BITS)
+    bitboards = []
+    for player in (1, 2):
+        packed = np.zeros((len(boards), 8), dtype=np.uint8)
+        packed[:, :6] = np.packbits(cells == player, axis=-1, bitorder="little")
+        bitboards.append(packed.view("<u8")[:, 0].astype(np.uint64))
+    return bitboards[0], bitboards[1]
+
+
+def has_four(discs: np.ndarray) -> np.ndarray:
+    """
+    Return which of an array of bitboards hold four in a row.
+    """
+    four = np.zeros(len(discs), dtype=bool)
+    for step in STEPS:
+        step = np.uint64(step)
+        pairs = discs & (discs >> step)
+        four |= (pairs & (pairs >> (step + step))) != 0
+    return four
+
+
+def open_window_score(mine: np.ndarray, theirs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Add up WINDOW_SCORES over the windows evaluate_board looks at, for the windows that
+    hold discs of mine and none of theirs, and find the positions where one of those
+    windows holds four of mine. Each window's discs are counted for all positions at
+    once by shifting its four cells onto its lowest bit and adding them up bit by bit:
+    sum_low and carry_low are the ones and twos digits of the first two cells, low the
+    ones digit of all four and the carries which twos there are.
+    """
+    score = np.zeros(len(mine), dtype=np.int32)
+    four = np.zeros(len(mine), dtype=bool)
+    for step, mask in EVAL_MASKS:
+        shifted = [mine, mine >> step, mine >> (step + step), mine >> (step + step + step)]
+        blocked = theirs | (theirs >> step) | (theirs >> (step + step)) | (theirs >> (step + step + step))
+        open_windows = mask & ~blocked
+
+        sum_low, carry_low = shifted[0] ^ shifted[1], shifted[0] & shifted[1]
+        sum_high, carry_high = shifted[2] ^ shifted[3], shifted[2] & shifted[3]
+        low = sum_low ^ sum_high
+        carry_mid = sum_low & sum_high
+        # at most two of the three twos can be set at once, four discs being carry_low & carry_high
+        one_two = carry_low ^ carry_high ^ carry_mid
+        no_two = ~(carry_low | carry_high | carry_mid)
+
+        for count, windows in ((1, low & no_two), (2, ~low & one_two), (3, low & one_two)):
+            score += OPEN_WINDOW_SCORES[count] * _popcount(windows & open_windows).astype(np.int32)
+        four |= (carry_low & carry_high & mask) != 0
+    return score, four
+
+
+def _evaluate_chunk(boards: np.ndarray, players: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Work out the winners, draws and scores of a chunk of positions on bitboards.
+    """
+    discs_1, discs_2 = to_bitboards(boards)
+    four_1, four_2 = has_four(discs_1), has_four(discs_2)
+    winners = np.where(four_1, 1, np.where(four_2, 2, 0)).astype(np.int8)
+    draws = ~four_1 & ~four_2 & (_popcount(discs_1 | discs_2) == 42)
+
+    # the center part always favours player 1, whoever the score is for
+    center = np.zeros(len(boards), dtype=np.int32)
+    for weight, mask in CENTER_MASKS.items():
+        center += weight * (_popcount(discs_1 & mask).astype(np.int32) - _popcount(discs_2 & mask).astype(np.int32))
+    score_1, eval_four_1 = open_window_score(discs_1, discs_2)
+    score_2, eval_four_2 = open_window_score(discs_2, discs_1)
+    window_score = score_1 - score_2
+    scores = center + np.where(players == 1, window_score, -window_score)
+
+    # evaluate_board returns on the first completed window it visits
+    scores = np.where(eval_four_1, np.where(players == 1, 1000, -1000), scores)
+    scores = np.where(eval_four_2, np.where(players == 2, 1000, -1000), scores)
+
+    # which four in a row the scalar functions see first only matters when both players have one
+    both = np.flatnonzero(four_1 & four_2)
+    if len(both):
+        winners[both], draws[both], scores[both] = _evaluate_by_windows(boards[both], players[both])
+    return winners, draws, scores.astype(np.int32)
+
+
+def evaluate_batch(boards, player: Union[int, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Score many Connect 4 positions at once. boards is an (N, 6, 7) array laid out like
+    Connect4.board (0 empty, 1 and 2 the players, row 0 at the top) and player is the
+    player to score for, one for all positions or an array of N. Returns three arrays
+    of N: the winner (0 for none) as Connect4.check_win finds it, whether the position
+    is a draw as in Connect4.check_draw, and the evaluate_board score. All three are
+    exactly what the scalar functions give, including which player wins when both have
+    four in a row.
+    """
+    boards = _as_batch(boards)
+    players = np.broadcast_to(np.asarray(player, dtype=np.int8), (len(boards),))
+
+    winners = np.empty(len(boards), dtype=np.int8)
+    draws = np.empty(len(boards), dtype=bool)
+    scores = np.empty(len(boards), dtype=np.int32)
+    for start in range(0, len(boards), CHUNK):
+        end = start + CHUNK
+        winners[start:end], draws[start:end], scores[start:end] = _evaluate_chunk(boards[start:end], players[start:end])
+    return winners, draws, scores
+
+
+def check_win_batch(boards) -> np.ndarray:
+    """
+    Return the winner of every position of an (N, 6, 7) array, 0 where nobody has won.
+    """
+    return evaluate_batch(boards, 1)[0]
+
+
+def check_draw_batch(boards) -> np.ndarray:
+    """
+    Return whether every position of an (N, 6, 7) array is a draw.
+    """
+    return evaluate_batch(boards, 1)[1]
@@ -0,0 +1,320 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+from Connect4 import Connect4, IncrementalEvaluator, EVAL_WINDOWS, WINDOW_SCORES
+from TranspositionTable import ZOBRIST_KEYS
+
+WIDTH = 7
+HEIGHT = 6
+# every column gets one extra sentinel bit on top so shifts never wrap into the next column
+COLUMN_BITS = HEIGHT + 1
+
+BOTTOM_MASK = sum(1 << (col * COLUMN_BITS) for col in range(WIDTH))
+BOARD_MASK = BOTTOM_MASK * ((1 << HEIGHT) - 1)
+COLUMN_MASKS = [((1 << HEIGHT) - 1) << (col * COLUMN_BITS) for col in range(WIDTH)]
+
+# vertical, horizontal, "\" diagonal and "/" diagonal
+DIRECTIONS = (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1)
+
+
+def cell_bit(row: int, col: int) -> int:
+    """
+    Get the bit of a cell given in Connect4.board coordinates, where row 0 is the
+    top of the board and row 5 is the bottom.
+    """
+    return 1 << (col * COLUMN_BITS + HEIGHT - 1 - row)
+
+
+def has_four(bits: int) -> bool:
+    """
+    Check if a player's bitboard contains four in a row in any direction.
+    Each direction is checked with two shift-and-mask steps.
+    """
+    for shift in DIRECTIONS:
+        pairs = bits & (bits >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+# all 7 bits of one column, sentinel included
+_COLUMN_FIELDS = [0x7F << (col * COLUMN_BITS) for col in range(WIDTH)]
+
+
+def mirror_bits(bits: int) -> int:
+    """
+    Reflect a bitboard (or a position key) left to right by reversing the order of
+    its 7 bit columns: the middle one stays, the others swap with their partner.
+    """
+    return (bits & _COLUMN_FIELDS[3] |
+            (bits & _COLUMN_FIELDS[0]) << 42 | (bits & _COLUMN_FIELDS[6]) >> 42 |
+            (bits & _COLUMN_FIELDS[1]) << 28 | (bits & _COLUMN_FIELDS[5]) >> 28 |
+            (bits & _COLUMN_FIELDS[2]) << 14 | (bits & _COLUMN_FIELDS[4]) >> 14)
+
+
+def mirror_column(col: int) -> int:
+    return WIDTH - 1 - col
+
+
+# MIRRORED_ZOBRIST_KEYS[player][bit] is the key of the cell bit lands on in the mirror image,
+# so the hash of the mirrored position can be kept up to date next to the hash itself
+MIRRORED_ZOBRIST_KEYS = [[keys[mirror_column(bit // COLUMN_BITS) * COLUMN_BITS + bit % COLUMN_BITS] for bit in range(49)]
+                         for keys in ZOBRIST_KEYS]
+
+
+class Bitboard:
+    """
+    A Connect 4 position stored as one integer per player plus the height of every
+    column. Bit (col * 7 + h) is the cell h discs up from the bottom of the column,
+    so dropping a disc, undoing it and checking for four in a row are all a handful
+    of integer operations instead of scans over the 6x7 grid. A Zobrist hash of the
+    position and one of its mirror image are kept up to date on every play and undo.
+    """
+    def __init__(self, board: Optional[List[List[int]]] = None):
+        """
+        Initialize the position, optionally from a board in the Connect4.board format.
+        """
+        self.boards = [0, 0, 0]  # indexed by player, slot 0 is unused
+        self.heights = [0] * WIDTH
+        self.history: List[int] = []
+        self.hash = 0
+        self.mirror_hash = 0
+        self.evaluator: Optional[IncrementalEvaluator] = None
+
+        if board and len(board) == HEIGHT:
+            for row in range(HEIGHT):
+                for col in range(WIDTH):
+                    if board[row][col]:
+                        self.boards[board[row][col]] |= cell_bit(row, col)
+                        self.hash ^= ZOBRIST_KEYS[board[row][col]][col * COLUMN_BITS + HEIGHT - 1 - row]
+                        self.mirror_hash ^= MIRRORED_ZOBRIST_KEYS[board[row][col]][col * COLUMN_BITS + HEIGHT - 1 - row]
+                        self.heights[col] += 1
+
+    @classmethod
+    def from_connect4(cls, game: Connect4) -> Bitboard:
+        """
+        Build a bitboard from an existing Connect4 game.
+        """
+        return cls(game.board)
+
+    def __str__(self):
+        return str(self.to_connect4())
+
+    def copy(self) -> Bitboard:
+        """
+        Return an independent copy of the position.
+        """
+        other = Bitboard()
+        other.boards = self.boards.copy()
+        other.heights = self.heights.copy()
+        other.history = self.history.copy()
+        other.hash = self.hash
+        other.mirror_hash = self.mirror_hash
+        return other
+
+    def to_board(self) -> List[List[int]]:
+        """
+        Convert the position back into the list of rows used by Connect4.board.
+        """
+        board = [[0] * WIDTH for _ in range(HEIGHT)]
+        for row in range(HEIGHT):
+            for col in range(WIDTH):
+                bit = cell_bit(row, col)
+                if self.boards[1] & bit:
+                    board[row][col] = 1
+                elif self.boards[2] & bit:
+                    board[row][col] = 2
+        return board
+
+    def to_connect4(self) -> Connect4:
+        """
+        Convert the position into a Connect4 game.
+        """
+        return Connect4(self.to_board())
+
+    def key(self) -> int:
+        """
+        Encode the position as a unique integer below 2 ** 49. Adding the bottom row to
+        the occupied cells leaves exactly one marker bit above the top disc of every
+        column, and player 1's discs all sit below those markers.
+        """
+        return self.boards[1] | ((self.boards[1] | self.boards[2]) + BOTTOM_MASK)
+
+    def canonical_key(self) -> Tuple[int, bool]:
+        """
+        The key shared by the position and its mirror image, the smaller of their two
+        keys, and whether it is the mirror image's. A column stored under the key has
+        to be mirrored with mirror_column when it is True.
+        """
+        key = self.key()
+        mirrored = mirror_bits(key)
+        return (mirrored, True) if mirrored < key else (key, False)
+
+    def canonical_hash(self) -> Tuple[int, bool]:
+        """
+        The Zobrist hash shared by the position and its mirror image, the smaller of the
+        two, and whether it is the mirror image's, like canonical_key.
+        """
+        return (self.mirror_hash, True) if self.mirror_hash < self.hash else (self.hash, False)
+
+    def is_symmetric(self) -> bool:
+        """
+        Check if the position is its own mirror image.
+        """
+        return self.hash == self.mirror_hash and self.boards[1] == mirror_bits(self.boards[1]) \
+            and self.boards[2] == mirror_bits(self.boards[2])
+
+    def mirrored(self) -> Bitboard:
+        """
+        Return the position reflected left to right.
+        """
+        other = Bitboard([row[::-1] for row in self.to_board()])
+        other.history = [mirror_column(col) for col in self.history]
+        return other
+
+    def moves_played(self) -> int:
+        """
+        Count the discs on the board.
+        """
+        return (self.boards[1] | self.boards[2]).bit_count()
+
+    def can_play(self, col: int) -> bool:
+        """
+        Check if a disc can be dropped into the (0-indexed) column.
+        """
+        return self.heights[col] < HEIGHT
+
+    def play(self, col: int, player: int):
+        """
+        Drop a disc for the player into the (0-indexed) column. The column is
+        assumed to have room, use can_play to check beforehand.
+        """
+        index = col * COLUMN_BITS + self.heights[col]
+        self.boards[player] |= 1 << index
+        self.hash ^= ZOBRIST_KEYS[player][index]
+        self.mirror_hash ^= MIRRORED_ZOBRIST_KEYS[player][index]
+        if self.evaluator is not None:
+            self.evaluator.add(HEIGHT - 1 - self.heights[col], col, player)
+        self.heights[col] += 1
+        self.history.append(col)
+
+    def undo(self):
+        """
+        Take back the last disc that was played.
+        """
+        col = self.history.pop()
+        self.heights[col] -= 1
+        index = col * COLUMN_BITS + self.heights[col]
+        player = 1 if self.boards[1] >> index & 1 else 2
+        self.boards[player] ^= 1 << index
+        self.hash ^= ZOBRIST_KEYS[player][index]
+        self.mirror_hash ^= MIRRORED_ZOBRIST_KEYS[player][index]
+        if self.evaluator is not None:
+            self.evaluator.remove(HEIGHT - 1 - self.heights[col], col, player)
+
+    def pop_disc(self) -> Optional[int]:
+        """
+        Take back the last disc, mirroring Connect4.pop_disc. Returns its (1-indexed)
+        column, or None if no disc has been played.
+        """
+        if not self.history:
+            return None
+        col = self.history[-1]
+        self.undo()
+        return col + 1
+
+    def drop_disc(self, column: int, player: int) -> bool:
+        """
+        Drop a disc into the specified (1-indexed) column for the given player,
+        mirroring Connect4.drop_disc. Returns False if the column is full.
+        """
+        if not self.can_play(column - 1):
+            return False
+        self.play(column - 1, player)
+        return True
+
+    def check_win(self) -> Optional[int]:
+        """
+        Return the player that has four in a row, or None if nobody has.
+        """
+        if has_four(self.boards[1]):
+            return 1
+        if has_four(self.boards[2]):
+            return 2
+        return None
+
+    def last_move_winner(self) -> Optional[int]:
+        """
+        Check only the board of the player who made the last move, since nobody else
+        can have just won. Falls back to check_win when there is no move history.
+        """
+        if not self.history:
+            return self.check_win()
+        col = self.history[-1]
+        player = 1 if self.boards[1] >> (col * COLUMN_BITS + self.heights[col] - 1) & 1 else 2
+        if has_four(self.boards[player]):
+            return player
+        return None
+
+    def is_full(self) -> bool:
+        """
+        Check if every cell of the board is taken.
+        """
+        return self.boards[1] | self.boards[2] == BOARD_MASK
+
+    def check_draw(self) -> bool:
+        """
+        Check if the game is a draw. A draw occurs when the board is full and there are no winners.
+        """
+        return self.is_full() and self.check_win() is None
+
+    def get_available_moves(self) -> List[int]:
+        """
+        Get a list of available moves (columns) where a disc can be dropped.
+        """
+        return [col for col in range(WIDTH) if self.heights[col] < HEIGHT]
+
+    def distinct_moves(self) -> List[int]:
+        """
+        The available moves, leaving out the right half of the board when the position
+        is symmetric, since those moves only lead to mirror images of the left half's.
+        """
+        if self.is_symmetric():
+            return [col for col in range(WIDTH // 2 + 1) if self.heights[col] < HEIGHT]
+        return self.get_available_moves()
+
+    def track_evaluation(self) -> IncrementalEvaluator:
+        """
+        Attach an IncrementalEvaluator to the position that follows every play and undo.
+        """
+        self.evaluator = IncrementalEvaluator(self.to_board())
+        return self.evaluator
+
+
+# the windows of evaluate_board as bit masks, in the same order
+EVAL_WINDOW_MASKS = [sum(cell_bit(row, col) for row, col in window) for window in EVAL_WINDOWS]
+CENTER_MASKS = [(COLUMN_MASKS[3], 3), (COLUMN_MASKS[2], 2), (COLUMN_MASKS[4], 2), (COLUMN_MASKS[1], 1), (COLUMN_MASKS[5], 1)]
+
+
+def evaluate_bitboard(board: Bitboard, player: int) -> int:
+    """
+    Evaluate the bitboard for the given player. Gives exactly the same score as
+    evaluate_board on the equivalent Connect4 board, but counts every window with a
+    popcount instead of walking its cells.
+    """
+    mine = board.boards[player]
+    theirs = board.boards[3 - player]
+
+    eval = 0
+    for mask, weight in CENTER_MASKS:
+        eval += weight * ((board.boards[1] & mask).bit_count() - (board.boards[2] & mask).bit_count())
+
+    for mask in EVAL_WINDOW_MASKS:
+        count_1 = (mine & mask).bit_count()
+        count_2 = (theirs & mask).bit_count()
+        if count_1 == 4:
+            return 1000
+        elif count_2 == 4:
+            return -1000
+        eval += WINDOW_SCORES[count_1][count_2]
+
+    return eval
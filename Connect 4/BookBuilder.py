@@ -0,0 +1,179 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Bitboard import Bitboard, WIDTH
+from OpeningBook import BOOK_PATH, RECORD, OpeningBook, canonical_entry, read_book, write_book
+import argparse
+import importlib.util
+import os
+
+BOTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Connect4 Bots.py")
+
+# the engine used by each worker process, created on its first task
+_worker_bot = None
+
+
+def load_bots():
+    """
+    Import "Connect4 Bots.py", which can not be imported by name because of the space.
+    """
+    spec = importlib.util.spec_from_file_location("Connect4Bots", BOTS_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def enumerate_positions(max_ply: int, players: Iterable[int] = (1, 2)) -> List[Bitboard]:
+    """
+    Find every position reachable from the empty board in at most max_ply moves where
+    the game is not over yet, with player 1 moving first. Transpositions are only kept
+    once, and of a position and its mirror image only the first one found is kept (both
+    share one canonical key). Only positions where one of players is to move are
+    returned.
+    """
+    players = set(players)
+    positions = []
+    frontier = [Bitboard()]
+    seen = {Bitboard().key()}
+
+    for ply in range(max_ply + 1):
+        player = 1 if ply % 2 == 0 else 2
+        if player in players:
+            positions.extend(frontier)
+        if ply == max_ply:
+            break
+
+        next_frontier = []
+        for board in frontier:
+            for move in board.get_available_moves():
+                child = board.copy()
+                child.play(move, player)
+                if child.check_win() is not None or child.is_full():
+                    continue
+                canonical = child.canonical_key()[0]
+                if canonical in seen:
+                    continue
+                seen.add(canonical)
+                next_frontier.append(child)
+        frontier = next_frontier
+
+    return positions
+
+
+def positions_from_games(games: Iterable[Sequence[int]], max_ply: int) -> List[Bitboard]:
+    """
+    Collect the positions of the first max_ply moves of games, each given as its
+    (0-indexed) columns with player 1 moving first, in the same form as
+    enumerate_positions: positions that are over are left out, and of a position and
+    its mirror image only the first one found is kept. A game stops being followed at a
+    move that does not fit on the board.
+    """
+    positions = []
+    seen = set()
+    for moves in games:
+        board = Bitboard()
+        for ply in range(min(max_ply, len(moves)) + 1):
+            if board.check_win() is not None or board.is_full():
+                break
+            canonical = board.canonical_key()[0]
+            if canonical not in seen:
+                seen.add(canonical)
+                positions.append(board.copy())
+            if ply == len(moves) or not 0 <= moves[ply] < WIDTH or not board.can_play(moves[ply]):
+                break
+            board.play(moves[ply], 1 if ply % 2 == 0 else 2)
+    return positions
+
+
+def _solve(board: List[List[int]], player: int, depth: int, time_budget: Optional[float]) -> int:
+    """
+    Search one position in a worker process and return the best move for player.
+    """
+    global _worker_bot
+    if _worker_bot is None:
+        _worker_bot = load_bots().PlayPro()
+        _worker_bot.use_book = False
+
+    if time_budget is None:
+        return _worker_bot.minimax(board, depth, player)
+    return _worker_bot.search(board, player, time_budget, depth)
+
+
+def read_checkpoint(path: str) -> Dict[int, int]:
+    """
+    Read the (key, move) records solved so far, by canonical key. A record cut short
+    by an interrupted run is ignored.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as file:
+        data = file.read()
+    data = data[:len(data) - len(data) % RECORD.size]
+    return dict(canonical_entry(key, move) for key, move in RECORD.iter_unpack(data))
+
+
+def build_book(max_ply: int, depth: int = 9, time_budget: Optional[float] = None, workers: Optional[int] = None,
+               output: str = BOOK_PATH, checkpoint: Optional[str] = None, players: Iterable[int] = (1, 2),
+               merge: bool = True, positions: Optional[List[Bitboard]] = None) -> int:
+    """
+    Build an opening book of every position up to max_ply moves deep, or of the given
+    positions, for example those of recorded games from positions_from_games. Each unique
+    position is searched by PlayPro to the given depth (or with iterative deepening for
+    time_budget seconds) across a pool of worker processes. Results are appended to the
+    checkpoint file as they come in, under the key the position shares with its
+    mirror image, so an interrupted build picks up where it stopped when run again.
+    When every position is solved the checkpoint is sorted into the book at output,
+    keeping the entries of the existing book there unless merge is False. Returns the
+    number of positions in the book.
+    """
+    checkpoint = checkpoint or output + ".part"
+    solved = read_checkpoint(checkpoint)
+    if os.path.exists(checkpoint):
+        # cut off a record left half written by an interrupted run before appending to it
+        size = os.path.getsize(checkpoint)
+        os.truncate(checkpoint, size - size % RECORD.size)
+    if positions is None:
+        positions = enumerate_positions(max_ply, players)
+    players = set(players)
+    positions = [board for board in positions if board.canonical_key()[0] not in solved
+                 and (1 if board.moves_played() % 2 == 0 else 2) in players]
+    print(f"{len(solved)} book entries already solved, {len(positions)} positions to go")
+
+    with open(checkpoint, "ab") as file, ProcessPoolExecutor(workers) as executor:
+        futures = {}
+        for board in positions:
+            player = 1 if board.moves_played() % 2 == 0 else 2
+            futures[executor.submit(_solve, board.to_board(), player, depth, time_budget)] = board
+
+        for done, future in enumerate(as_completed(futures), 1):
+            key, move = canonical_entry(futures[future].key(), future.result())
+            solved[key] = move
+            file.write(RECORD.pack(key, move))
+            file.flush()
+            if done % 100 == 0 or done == len(futures):
+                print(f"Solved {done}/{len(futures)}")
+
+    # books from before canonical keys hold both mirror images, keep one of them
+    book = dict(canonical_entry(key, move) for key, move in read_book(output)) if merge and os.path.exists(output) else {}
+    book.update(solved)
+    # release this process's mapping of the old book before it is overwritten
+    OpeningBook.load(output).close()
+    write_book(output, book.items())
+    os.remove(checkpoint)
+    return len(book)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Connect 4 opening book.")
+    parser.add_argument("--ply", type=int, default=4, help="deepest position to include, in moves from the empty board")
+    parser.add_argument("--depth", type=int, default=9, help="search depth for every position")
+    parser.add_argument("--time", type=float, default=None, help="search every position for this many seconds instead")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--output", default=BOOK_PATH, help="book file to write")
+    parser.add_argument("--player", type=int, choices=(1, 2), action="append", help="only include positions where this player is to move")
+    parser.add_argument("--replace", action="store_true", help="do not keep the entries already in the book")
+    args = parser.parse_args()
+
+    count = build_book(args.ply, args.depth, args.time, args.workers, args.output,
+                       players=args.player or (1, 2), merge=not args.replace)
+    print(f"The book now holds {count} positions")
@@ -1,8 +1,111 @@
 from __future__ import annotations
-from typing import List, Optional
-from Connect4 import Connect4, evaluate_board
+from typing import Callable, Dict, List, Optional, Tuple
+from Connect4 import Connect4
+from Bitboard import Bitboard
+from TranspositionTable import TranspositionTable, SIDE_KEYS, NEGAMAX_KEY, EXACT, LOWER, UPPER, WIN_THRESHOLD, score_to_tt, score_from_tt
+from OpeningBook import OpeningBook
+from TableBase import TableBase
+from Threats import WIN, LOSS, OPEN, threat_analysis, safe_columns, with_threat_parity
+from MoveOrdering import MoveOrderer, KillerHistoryOrderer
+from Solver import Solver, SolveTimeout
+import cProfile
+import os
 import random
-import json
+import sys
+import threading
+import time
+
+# modules shared by both games live in the directory above
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from SearchStats import SearchStats, SearchTimeout, profiled
+
+# half width of the window around the previous iteration's score in iterative deepening
+ASPIRATION_WINDOW = 50
+
+# positions with at most this many empty cells are solved to the end instead of searched to a depth
+SOLVER_CELLS = 16
+
+# the search algorithms PlayPro can use
+MINIMAX = "minimax"
+PVS = "pvs"
+MTDF = "mtdf"
+
+
+def solved_score(score: int, empty: int, ply: int) -> int:
+    """
+    Convert a Solver score of a position with empty empty cells, ply plies from the
+    root, to the scale of the search: the solver counts wins by the empty cells left
+    after them, the search by plies from the root.
+    """
+    if score > 0:
+        return 1000 - (ply + empty - score + 1)
+    if score < 0:
+        return -1000 + (ply + empty + score + 1)
+    return 0
+
+
+class Connect4SearchStats(SearchStats):
+    """
+    SearchStats of PlayPro, which also counts its transposition table probes and hits,
+    how many of its cutoffs came from the first move tried, and whether the move came
+    from the opening book or the endgame solver.
+    """
+    def __init__(self):
+        SearchStats.__init__(self)
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.book_hit = False
+        self.solved = False
+        # first_move_cutoffs[ply] is the number of cutoffs at that ply that came from the first move tried
+        self.first_move_cutoffs: List[int] = []
+
+    def counting_probe(self, probe: Callable[[int], Optional[tuple]]) -> Callable[[int], Optional[tuple]]:
+        def counted(key: int) -> Optional[tuple]:
+            self.tt_probes += 1
+            entry = probe(key)
+            if entry is not None:
+                self.tt_hits += 1
+            return entry
+        return counted
+
+    def counting_cutoff(self, cutoff: Callable) -> Callable:
+        """
+        Wrap a MoveOrderer.cutoff so every cutoff is also counted by its ply.
+        """
+        def counted(board, move: int, ply: int, player: int, depth: int, index: int):
+            self.add_cutoff(ply, index)
+            cutoff(board, move, ply, player, depth, index)
+        return counted
+
+    def add_cutoff(self, ply: int, index: int = -1):
+        SearchStats.add_cutoff(self, ply)
+        while len(self.first_move_cutoffs) <= ply:
+            self.first_move_cutoffs.append(0)
+        if index == 0:
+            self.first_move_cutoffs[ply] += 1
+
+    def as_dict(self) -> Dict[str, object]:
+        stats = SearchStats.as_dict(self)
+        stats.update(tt_probes=self.tt_probes, tt_hits=self.tt_hits, book_hit=self.book_hit, solved=self.solved,
+                     first_move_cutoffs=self.first_move_cutoffs)
+        return stats
+
+    def describe_probes(self) -> str:
+        return f"{self.tt_hits} of {self.tt_probes} table probes hit"
+
+    def describe_cutoffs(self, ply: int) -> str:
+        return f", {self.first_move_cutoffs[ply] / self.cutoffs[ply]:.0%} by the first move"
+
+    def __str__(self):
+        if self.book_hit:
+            return "opening book move"
+        if self.solved and not self.ponder_hit:
+            return f"solved to the end: {self.nodes} nodes in {self.seconds:.3f}s, {self.depth} empty cells"
+        return SearchStats.__str__(self)
+
 
 class PlayConnect4:
     """
@@ -17,6 +120,42 @@ class PlayConnect4:
         Start the game. This method should be overridden in subclasses.
         """
         raise NotImplementedError
+
+    def new_game(self, position: Optional[List[List[int]]] = None):
+        """
+        Start a new game without any input or output, on an empty board or from a
+        Connect4.board position. Player 1 moves first.
+        """
+        self.board = Connect4(position)
+
+    def game_over(self) -> bool:
+        """
+        Check if the game has been won or drawn.
+        """
+        return self.board.check_win() is not None or self.board.check_draw()
+
+    def to_move(self) -> int:
+        """
+        Return the player whose turn it is.
+        """
+        return 1 if self.board.moves_played % 2 == 0 else 2
+
+    def apply_move(self, column: int) -> bool:
+        """
+        Drop a disc of the player to move into the (0-indexed) column. Returns False
+        and leaves the game as it was if the column is full or does not exist, or if
+        the game is already over.
+        """
+        if self.game_over() or not 0 <= column < 7:
+            return False
+        return self.board.drop_disc(column + 1, self.to_move())
+
+    def best_move(self, time_budget: Optional[float] = None) -> int:
+        """
+        Return the (0-indexed) column the bot would play for the player to move,
+        without playing it. This method should be overridden in subclasses.
+        """
+        raise NotImplementedError
     
 class PlayStupidBot(PlayConnect4):
     """
@@ -62,14 +201,63 @@ class PlayStupidBot(PlayConnect4):
         """
         return random.choice(self.board.get_available_moves())
 
+    def best_move(self, time_budget: Optional[float] = None) -> int:
+        """
+        Return a random (0-indexed) column for the player to move.
+        """
+        if self.game_over():
+            raise ValueError("the game is over")
+        return self.pick_random()
+
 
 class PlayPro(PlayConnect4):
     """
     A class representing a Connect 4 game with a stupid bot."""
-    def __init__(self):
+    def __init__(self, tt_mb: float = 16, time_budget: Optional[float] = None, orderer: Optional[MoveOrderer] = None,
+                 algorithm: str = MINIMAX, solver_cells: int = SOLVER_CELLS):
         """
-        Initialize the game with a Connect 4 board."""
+        Initialize the game with a Connect 4 board and a transposition table that
+        uses at most tt_mb megabytes. If time_budget is given, the bot searches every
+        move with iterative deepening for that many seconds instead of to depth 7.
+        The orderer decides which moves are searched first, by default the
+        transposition table move, killer moves and the history heuristic. The algorithm
+        is MINIMAX (alpha-beta), PVS (principal variation search) or MTDF. Positions
+        with at most solver_cells empty cells are solved exactly by a Solver instead,
+        0 turns that off."""
+        if algorithm not in (MINIMAX, PVS, MTDF):
+            raise ValueError(f"unknown search algorithm {algorithm!r}")
         PlayConnect4.__init__(self)
+        self.algorithm = algorithm
+        self.tt = TranspositionTable(tt_mb)
+        self.time_budget = time_budget
+        self.use_book = True
+        self.orderer = orderer if orderer is not None else KillerHistoryOrderer()
+        self.solver = Solver()
+        self.solver_cells = solver_cells
+        # solved endgames that the search and the solver look positions up in, None turns it off
+        self.tablebase: Optional[TableBase] = TableBase.load()
+        # number of nodes visited by the last minimax or search call
+        self.nodes = 0
+        # deepest iteration finished by the last search call and its score
+        self.depth = 0
+        self.score = None
+        # set when the table is shared with other processes, whose coordinator starts every search on it
+        self.shared_tt = False
+        # checked together with the deadline, a search stops early once it returns True
+        self.should_stop: Optional[Callable[[], bool]] = None
+        # when collect_stats is set, every minimax or search call leaves a SearchStats in self.stats
+        self.collect_stats = False
+        self.stats: Optional[Connect4SearchStats] = None
+        # a cProfile.Profile to run every minimax and search call under, see profile_report in SearchStats.py
+        self.profiler: Optional[cProfile.Profile] = None
+        # start searches the replies to every move of the opponent while it waits for them
+        self.ponder = True
+        self.ponder_thread: Optional[threading.Thread] = None
+        self.ponder_stop = threading.Event()
+        # opponent column -> (depth, reply, score) of the deepest search of that move finished while pondering
+        self.ponder_replies: Dict[int, Tuple[int, int, Optional[int]]] = {}
+        # the depth a pondered reply needs to be played without searching again
+        self.ponder_depth = 7
 
     def start(self):
         """
@@ -77,12 +265,18 @@ class PlayPro(PlayConnect4):
         """  
         print("Let the games begin! You will be playing as X and the bot will be playing as O. \n")
         print(self.board)
+        self.tt.clear()
 
         while self.board.check_win() is None and not self.board.check_draw():
-            move = int(input("Input your move: "))
+            if self.ponder:
+                self.start_pondering(2)
+            try:
+                move = int(input("Input your move: "))
 
-            while not self.board.drop_disc(move, 1):
-                move = int(input("Invalid move, input your move: "))
+                while not self.board.drop_disc(move, 1):
+                    move = int(input("Invalid move, input your move: "))
+            finally:
+                self.stop_pondering()
 
             print(f"You made dropped it at {move}. The current position of the board is: \n \n")
             print(self.board)
@@ -90,7 +284,11 @@ class PlayPro(PlayConnect4):
             if self.board.check_win():
                 break 
 
-            bot_move = self.minimax(self.board.board, 7, 2)
+            bot_move = self.pondered_reply(move - 1)
+            if bot_move is None and self.time_budget is None:
+                bot_move = self.minimax(self.board.board, 7, 2)
+            elif bot_move is None:
+                bot_move = self.search(self.board.board, 2, self.time_budget)
             self.board.drop_disc(bot_move+1, 2)
 
             print(f"The bot dropped it at {bot_move+1}. The current position of the board is: \n \n")
@@ -104,59 +302,585 @@ class PlayPro(PlayConnect4):
             print("The following game ended in a draw!")
     
 
+    def best_move(self, time_budget: Optional[float] = None) -> int:
+        """
+        Find the best (0-indexed) column for the player to move without playing it. The
+        move is searched with iterative deepening for time_budget seconds, or for
+        self.time_budget if that is not given, and to depth 7 if neither is set, like
+        start does.
+        """
+        if self.game_over():
+            raise ValueError("the game is over")
+        if time_budget is None:
+            time_budget = self.time_budget
+        if time_budget is None:
+            return self.minimax(self.board.board, 7, self.to_move())
+        return self.search(self.board.board, self.to_move(), time_budget)
+
+    @profiled
     def minimax(self, position: List[List[int]], depth: int, max_player: int) -> int:
-        original_player = max_player
-        max_depth = depth
+        """
+        Find the best move for max_player with a fixed depth search using
+        self.algorithm. Returns the (0-indexed) column to play and leaves its score in
+        self.score.
+        """
+        start = time.perf_counter()
+        stats = self.stats = Connect4SearchStats() if self.collect_stats else None
+        board = Bitboard(position)
+        book_move = self.opening_book_move(board)
+        if book_move is not None:
+            return book_move
+        solved_move = self.solve_endgame(board, max_player)
+        if solved_move is not None:
+            return solved_move
+
+        if not self.shared_tt:
+            self.tt.new_search()
+        self.orderer.new_search()
+        helper = self.make_search(board, max_player, stats=stats)
+        if self.algorithm == MTDF:
+            # MTD(f) needs a first guess, which comes from searching one ply less deep
+            score = 0
+            for iteration in range(1, depth + 1):
+                score, move = self.mtdf(helper, score, iteration, max_player)
+                if stats is not None:
+                    stats.add_iteration(iteration, helper.node_count(), time.perf_counter() - start)
+        else:
+            score, move = helper(depth, 0, float('-inf'), float('inf'), max_player)
+            if stats is not None:
+                stats.add_iteration(depth, helper.node_count(), time.perf_counter() - start)
+        self.nodes = helper.node_count()
+        self.score = score
+        if stats is not None:
+            stats.nodes, stats.seconds = self.nodes, time.perf_counter() - start
+        return move
+
+    @profiled
+    def search(self, position: List[List[int]], max_player: int, time_budget: float, max_depth: int = 42, start_depth: int = 1) -> int:
+        """
+        Find the best move for max_player with iterative deepening, searching one ply
+        deeper at a time from start_depth until time_budget seconds have passed. Every
+        iteration after the first searches a narrow aspiration window around the previous
+        score, and the previous best move is tried first through the transposition table.
+        Returns the best move of the deepest iteration that finished, whose depth and
+        score are left in self.depth and self.score.
+        """
+        start = time.perf_counter()
+        stats = self.stats = Connect4SearchStats() if self.collect_stats else None
+        board = Bitboard(position)
+        book_move = self.opening_book_move(board)
+        if book_move is not None:
+            return book_move
+        # the solver gets half of the time, the search what is left if it does not finish
+        solved_move = self.solve_endgame(board, max_player, start + time_budget / 2)
+        if solved_move is not None:
+            return solved_move
+
+        if not self.shared_tt:
+            self.tt.new_search()
+        self.orderer.new_search()
+        helper = self.make_search(board, max_player, start + time_budget, stats)
+        empty_cells = 42 - len([cell for row in position for cell in row if cell])
+        best_move = board.get_available_moves()[0]
+        score = None
+        self.depth = 0
+
+        for depth in range(min(start_depth, empty_cells), min(max_depth, empty_cells) + 1):
+            try:
+                if self.algorithm == MTDF:
+                    result, move = self.mtdf(helper, score or 0, depth, max_player)
+                else:
+                    if score is None:
+                        alpha, beta = float('-inf'), float('inf')
+                    else:
+                        alpha, beta = score - ASPIRATION_WINDOW, score + ASPIRATION_WINDOW
+                    result, move = helper(depth, 0, alpha, beta, max_player)
+
+                    # the score fell outside the window, so it is only a bound: search again with it open on that side
+                    if result <= alpha:
+                        result, move = helper(depth, 0, float('-inf'), beta, max_player)
+                    elif result >= beta:
+                        result, move = helper(depth, 0, alpha, float('inf'), max_player)
+            except SearchTimeout:
+                break
+
+            best_move, score = move, result
+            self.depth = depth
+            if stats is not None:
+                stats.add_iteration(depth, helper.node_count(), time.perf_counter() - start)
+            # a forced win or loss has been found, searching deeper will not change it
+            if abs(score) >= WIN_THRESHOLD:
+                break
+
+        self.nodes = helper.node_count()
+        self.score = score
+        if stats is not None:
+            stats.nodes, stats.seconds = self.nodes, time.perf_counter() - start
+        return best_move
+
+    def make_search(self, board: Bitboard, original_player: int, deadline: Optional[float] = None,
+                    stats: Optional[Connect4SearchStats] = None):
+        """
+        Build the search function of self.algorithm, see make_helper and make_negamax.
+        """
+        if self.algorithm == MINIMAX:
+            return self.make_helper(board, original_player, deadline, stats)
+        return self.make_negamax(board, original_player, deadline, stats)
+
+    def mtdf(self, negamax, guess: int, depth: int, max_player: int):
+        """
+        Run MTD(f) on top of a negamax search: a series of null window searches that
+        close in on the score from the first guess, each one cheap because the
+        transposition table remembers the earlier ones. Returns (score, move).
+        """
+        lower, upper = float('-inf'), float('inf')
+        score = guess
+        best_move = None
+        while lower < upper:
+            beta = score + 1 if score == lower else score
+            score, move = negamax(depth, 0, beta - 1, beta, max_player)
+            if score < beta:
+                upper = score
+            else:
+                lower = score
+                best_move = move
+            # a search that failed low only bounds the score, so its move is used only if nothing better is known
+            if best_move is None:
+                best_move = move
+        return score, best_move
+
+    def make_negamax(self, board: Bitboard, original_player: int, deadline: Optional[float] = None,
+                     stats: Optional[Connect4SearchStats] = None):
+        """
+        Build a negamax search with principal variation search for a position. The
+        returned negamax(depth, ply, alpha, beta, current_player) searches the first move
+        with the full window and every other move with a null window, which only proves
+        that the move is no better, and searches it again only if it turns out to be.
+        Scores are from the point of view of current_player, which at the root equals
+        those of make_helper. It stops and counts into stats like make_helper and has the
+        same node_count().
+        """
+        tt = self.tt
+        probe = tt.probe
+        order = self.orderer.order
+        cutoff = self.orderer.cutoff
+        side_keys = [key ^ NEGAMAX_KEY for key in SIDE_KEYS[original_player]]
+        evaluate = with_threat_parity(board, board.track_evaluation().evaluate)
+        if stats is not None:
+            evaluate, probe, cutoff = stats.counting_evaluate(evaluate), stats.counting_probe(probe), stats.counting_cutoff(cutoff)
+        should_stop = self.should_stop
+        # in a symmetric root position only one of every two mirrored moves is searched
+        root_moves = board.distinct_moves()
+        # positions with at most tablebase_cells empty cells are looked up in the tablebase
+        tablebase = self.tablebase
+        tablebase_cells = tablebase.cells if tablebase is not None else -1
+        root_empty = 42 - board.moves_played()
+        nodes = 0
+
+        def negamax(depth: int, ply: int, alpha, beta, current_player: int):
+            nonlocal nodes
+            nodes += 1
+            if not nodes & 255 and ((deadline is not None and time.perf_counter() > deadline) or
+                                    (should_stop is not None and should_stop())):
+                raise SearchTimeout
+
+            winner = board.last_move_winner()
+
+            if winner is not None:
+                return (1000 - ply if winner == current_player else -1000 + ply), None
+            elif board.is_full():
+                return 0, None
+
+            if ply and root_empty - ply <= tablebase_cells:
+                solved = tablebase.probe(board.boards[current_player], board.boards[1] | board.boards[2])
+                if solved is not None:
+                    return solved_score(solved, root_empty - ply, ply), None
+            if depth == 0:
+                # evaluate_board is not symmetric between the players, so always score for
+                # the original player and flip the sign for the other one
+                score = evaluate(original_player)
+                return (score if current_player == original_player else -score), None
+
+            # immediate wins and forced blocks are played without searching the other moves
+            outcome, safe = threat_analysis(board.boards[current_player], board.boards[1] | board.boards[2])
+            if outcome == WIN:
+                return 1000 - (ply + 1), safe
+            elif outcome == LOSS:
+                return -1000 + (ply + 2), safe
+
+            # a position and its mirror image share the entry of the smaller hash, its move mirrored for the other
+            mirrored = board.mirror_hash < board.hash
+            key = (board.mirror_hash if mirrored else board.hash) ^ side_keys[current_player]
+            entry = probe(key)
+            tt_move = None
+            if entry is not None:
+                tt_depth, flag, tt_score, tt_move = entry
+                if mirrored and tt_move is not None:
+                    tt_move = 6 - tt_move
+                if tt_depth >= depth:
+                    tt_score = score_from_tt(tt_score, ply)
+                    if flag == EXACT:
+                        return tt_score, tt_move
+                    elif flag == LOWER:
+                        alpha = max(alpha, tt_score)
+                    else:
+                        beta = min(beta, tt_score)
+                    if beta <= alpha:
+                        return tt_score, tt_move
+            alpha_start, beta_start = alpha, beta
+
+            moves = order(board, safe_columns(safe, board.get_available_moves() if ply else root_moves), ply, current_player, tt_move)
+            best_move = moves[0]
+            best_score = float("-inf")
+            opponent = 3 - current_player
+
+            for index, move in enumerate(moves):
+                board.play(move, current_player)
+                if index == 0:
+                    score = -negamax(depth - 1, ply + 1, -beta, -alpha, opponent)[0]
+                else:
+                    score = -negamax(depth - 1, ply + 1, -alpha - 1, -alpha, opponent)[0]
+                    if alpha < score < beta:
+                        score = -negamax(depth - 1, ply + 1, -beta, -alpha, opponent)[0]
+                board.undo()
+
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+                if score > alpha:
+                    alpha = score
+                if beta <= alpha:
+                    cutoff(board, move, ply, current_player, depth, index)
+                    break
 
-        def helper(position: List[List[int]], depth: int, alpha, beta, current_player: int):
-            temp_board = Connect4(position)
-            winner = temp_board.check_win()
+            if best_score <= alpha_start:
+                flag = UPPER
+            elif best_score >= beta_start:
+                flag = LOWER
+            else:
+                flag = EXACT
+            tt.store(key, depth, flag, score_to_tt(best_score, ply), 6 - best_move if mirrored else best_move)
+
+            return best_score, best_move
+
+        def node_count() -> int:
+            return nodes
+
+        negamax.node_count = node_count
+        return negamax
+
+    def make_helper(self, board: Bitboard, original_player: int, deadline: Optional[float] = None,
+                    stats: Optional[Connect4SearchStats] = None):
+        """
+        Build the alpha-beta search function for a position. The returned
+        helper(depth, ply, alpha, beta, current_player) plays and undoes moves in place
+        on board and returns (score, move) from the point of view of original_player.
+        If a deadline is given it raises SearchTimeout once time.perf_counter() passes it,
+        and likewise once self.should_stop returns True.
+        helper.node_count() returns the number of nodes it has visited so far. If stats
+        is given, the leaf evaluations, table probes and cutoffs are counted into it.
+        """
+        tt = self.tt
+        probe = tt.probe
+        order = self.orderer.order
+        cutoff = self.orderer.cutoff
+        side_keys = SIDE_KEYS[original_player]
+        # leaves read the score kept up to date by every play and undo instead of rescanning the board
+        evaluate = with_threat_parity(board, board.track_evaluation().evaluate)
+        if stats is not None:
+            evaluate, probe, cutoff = stats.counting_evaluate(evaluate), stats.counting_probe(probe), stats.counting_cutoff(cutoff)
+        should_stop = self.should_stop
+        # in a symmetric root position only one of every two mirrored moves is searched
+        root_moves = board.distinct_moves()
+        # positions with at most tablebase_cells empty cells are looked up in the tablebase
+        tablebase = self.tablebase
+        tablebase_cells = tablebase.cells if tablebase is not None else -1
+        root_empty = 42 - board.moves_played()
+        nodes = 0
+
+        def helper(depth: int, ply: int, alpha, beta, current_player: int):
+            nonlocal nodes
+            nodes += 1
+            if not nodes & 255 and ((deadline is not None and time.perf_counter() > deadline) or
+                                    (should_stop is not None and should_stop())):
+                raise SearchTimeout
+
+            winner = board.last_move_winner()
 
             if winner == original_player:
-                return 1000 - (max_depth - depth), None
+                return 1000 - ply, None
             elif winner == (3 - original_player):
-                return -1000 + (max_depth - depth), None
-            elif temp_board.check_draw():
+                return -1000 + ply, None
+            elif board.is_full():
                 return 0, None
-            elif depth == 0:
-                return evaluate_board(temp_board, original_player), None
 
-            best_move = temp_board.get_available_moves()[0]
+            if ply and root_empty - ply <= tablebase_cells:
+                solved = tablebase.probe(board.boards[current_player], board.boards[1] | board.boards[2])
+                if solved is not None:
+                    score = solved_score(solved, root_empty - ply, ply)
+                    return (score if current_player == original_player else -score), None
+            if depth == 0:
+                return evaluate(original_player), None
+
+            # immediate wins and forced blocks are played without searching the other moves
+            outcome, safe = threat_analysis(board.boards[current_player], board.boards[1] | board.boards[2])
+            if outcome != OPEN:
+                score = 1000 - (ply + 1) if outcome == WIN else -1000 + (ply + 2)
+                return (score if current_player == original_player else -score), safe
+
+            # positions reached through another move order are looked up instead of searched again, and
+            # a position and its mirror image share the entry of the smaller hash, its move mirrored for the other
+            mirrored = board.mirror_hash < board.hash
+            key = (board.mirror_hash if mirrored else board.hash) ^ side_keys[current_player]
+            entry = probe(key)
+            tt_move = None
+            if entry is not None:
+                tt_depth, flag, tt_score, tt_move = entry
+                if mirrored and tt_move is not None:
+                    tt_move = 6 - tt_move
+                if tt_depth >= depth:
+                    tt_score = score_from_tt(tt_score, ply)
+                    if flag == EXACT:
+                        return tt_score, tt_move
+                    elif flag == LOWER:
+                        alpha = max(alpha, tt_score)
+                    else:
+                        beta = min(beta, tt_score)
+                    if beta <= alpha:
+                        return tt_score, tt_move
+            alpha_start, beta_start = alpha, beta
+
+            moves = order(board, safe_columns(safe, board.get_available_moves() if ply else root_moves), ply, current_player, tt_move)
+            best_move = moves[0]
             if current_player == original_player:
                 best_score = float("-inf")
             else:
                 best_score = float("inf")
 
-            for move in temp_board.get_available_moves():
-                new_board = Connect4(position)
-                new_board.drop_disc(move + 1, current_player)
-                score, _ = helper(new_board.board, depth - 1, alpha, beta, 3 - current_player)
+            for index, move in enumerate(moves):
+                board.play(move, current_player)
+                score, _ = helper(depth - 1, ply + 1, alpha, beta, 3 - current_player)
+                board.undo()
 
                 if current_player == original_player:
                     if score > best_score:
                         best_score = score
                         best_move = move
                     alpha = max(alpha, best_score)
-                    if beta <= alpha:
-                        break
                 else:
                     if score < best_score:
                         best_score = score
                         best_move = move
                     beta = min(beta, best_score)
-                    if beta <= alpha:
-                        break
+                if beta <= alpha:
+                    cutoff(board, move, ply, current_player, depth, index)
+                    break
+
+            if best_score <= alpha_start:
+                flag = UPPER
+            elif best_score >= beta_start:
+                flag = LOWER
+            else:
+                flag = EXACT
+            tt.store(key, depth, flag, score_to_tt(best_score, ply), 6 - best_move if mirrored else best_move)
 
             return best_score, best_move
 
+        def node_count() -> int:
+            return nodes
+
+        helper.node_count = node_count
+        return helper
+
+    def start_pondering(self, player: int):
+        """
+        Start searching, in a background thread, the best reply of player to every move
+        the opponent can make in the position on self.board, one ply deeper at a time
+        for all of them, with the opponent's likeliest moves first. The searches fill
+        the transposition table, so even a reply that was not pondered deep enough
+        is found quicker afterwards. Call stop_pondering before searching again.
+        """
+        self.stop_pondering()
+        # a pondered reply is used if it is as deep as the search that would replace it
+        self.ponder_depth = 7 if self.time_budget is None else (self.depth or 7)
+        self.ponder_replies = {}
+        self.ponder_stop = threading.Event()
+        position = [row.copy() for row in self.board.board]
+        self.ponder_thread = threading.Thread(target=self.ponder_replies_of, daemon=True,
+                                              args=(position, player, self.ponder_stop, self.ponder_replies))
+        self.ponder_thread.start()
+
+    def stop_pondering(self) -> Dict[int, Tuple[int, int, Optional[int]]]:
+        """
+        Stop the pondering thread and wait for it. Returns the replies it found.
+        """
+        if self.ponder_thread is not None:
+            self.ponder_stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+        return self.ponder_replies
+
+    def ponder_replies_of(self, position: List[List[int]], player: int, stop: threading.Event,
+                          replies: Dict[int, Tuple[int, int, Optional[int]]]):
+        """
+        The pondering thread: search the replies to every move of the opponent with
+        minimax until stop is set, storing the deepest result of each in replies.
+        """
+        opponent = 3 - player
+        columns = Connect4(position).get_available_moves()
+        empty_cells = 42 - len([cell for row in position for cell in row if cell])
+        default_should_stop = self.should_stop
+        self.should_stop = stop.is_set
         try:
-            with open('opening_book.json', 'r') as file:
-                opening_book = json.load(file)
-                key = self.board.serialize()
-                if key in opening_book:
-                    return opening_book[key]
-        except FileNotFoundError:
+            for depth in range(1, empty_cells):
+                for col in columns:
+                    if stop.is_set():
+                        return
+                    reply = replies.get(col)
+                    if reply is not None and reply[2] is not None and abs(reply[2]) >= WIN_THRESHOLD:
+                        # already searched to the end of the game
+                        continue
+                    child = Connect4(position)
+                    child.drop_disc(col + 1, opponent)
+                    if child.check_win() is not None or child.check_draw():
+                        continue
+                    # an opening book move leaves no score
+                    self.score = None
+                    move = self.minimax(child.board, depth, player)
+                    replies[col] = (depth, move, self.score)
+                # the moves that are worst for player are the likeliest, so they go first
+                columns.sort(key=lambda col: (replies[col][2] or 0) if col in replies else 0)
+        except SearchTimeout:
             pass
+        finally:
+            self.should_stop = default_should_stop
+
+    def pondered_reply(self, column: int) -> Optional[int]:
+        """
+        The reply pondered to the opponent's (0-indexed) column, if it was searched at
+        least self.ponder_depth deep, or None if it has to be searched.
+        """
+        reply = self.ponder_replies.get(column)
+        self.ponder_replies = {}
+        if reply is None or reply[0] < self.ponder_depth:
+            return None
+        if self.collect_stats:
+            self.stats = Connect4SearchStats()
+            self.stats.ponder_hit = True
+        return reply[1]
 
-        return helper(position, depth, float('-inf'), float('inf'), max_player)[1]
+    def solve_endgame(self, board: Bitboard, max_player: int, deadline: Optional[float] = None) -> Optional[int]:
+        """
+        Solve a position with at most self.solver_cells empty cells to the end, if
+        max_player is the one to move. Returns the move and leaves its exact score in
+        self.score, on the same scale as the search (1000 - plies to a win, -1000 +
+        plies to a loss, 0 for a draw), the empty cells in self.depth and the nodes in
+        self.nodes. Returns None if the position is not one to solve, or if the
+        deadline passes or self.should_stop returns True before it is solved.
+        """
+        empty = 42 - board.moves_played()
+        to_move = 1 if board.moves_played() % 2 == 0 else 2
+        if empty > self.solver_cells or to_move != max_player or board.check_win() is not None or board.is_full():
+            return None
+
+        should_stop = self.should_stop
+        def stop() -> bool:
+            return (deadline is not None and time.perf_counter() > deadline) or (should_stop is not None and should_stop())
+
+        start = time.perf_counter()
+        self.solver.tablebase = self.tablebase
+        try:
+            score, move = self.solver.solve(board, max_player, should_stop=stop)
+        except SolveTimeout:
+            return None
 
+        self.score = solved_score(score, empty, 0)
+        self.depth = empty
+        self.nodes = self.solver.nodes
+        if self.stats is not None:
+            self.stats.solved = True
+            self.stats.add_iteration(empty, self.nodes, time.perf_counter() - start)
+        return move
+
+    def opening_book_move(self, board: Bitboard) -> Optional[int]:
+        """
+        Look up a position in the opening book. Returns the move to play or None if
+        the position is not in the book.
+        """
+        if not self.use_book:
+            return None
+        move = OpeningBook.load().get_move(board)
+        if move is not None and self.stats is not None:
+            self.stats.book_hit = True
+        return move
+
+
+class PlayMCTS(PlayConnect4):
+    """
+    A class representing a Connect 4 game with a Monte Carlo Tree Search bot. It does
+    not use an evaluation at all: every move is judged by how many random games
+    played from it are won, so it gets stronger the more playouts it is given. It
+    needs NumPy."""
+    def __init__(self, playouts: Optional[int] = 20000, time_budget: Optional[float] = None,
+                 exploration: Optional[float] = None, seed: Optional[int] = None):
+        """
+        Initialize the game with a Connect 4 board. The bot plays playouts random games
+        per move, or searches every move for time_budget seconds instead if that is
+        given. exploration is the UCT constant, seed makes the games repeatable."""
+        # imported here so the other bots work without NumPy
+        from MCTS import MCTS, EXPLORATION
+        PlayConnect4.__init__(self)
+        self.playouts = playouts
+        self.time_budget = time_budget
+        self.mcts = MCTS(EXPLORATION if exploration is None else exploration, seed=seed)
+
+    def new_game(self, position: Optional[List[List[int]]] = None):
+        PlayConnect4.new_game(self, position)
+        self.mcts.clear()
+
+    def start(self):
+        """
+        Start the game with the Monte Carlo bot, which moves second.
+        """
+        print("Let the games begin! You will be playing as X and the bot will be playing as O. \n")
+        print(self.board)
+        self.mcts.clear()
+
+        while self.board.check_win() is None and not self.board.check_draw():
+            move = int(input("Input your move: "))
+
+            while not self.board.drop_disc(move, 1):
+                move = int(input("Invalid move, input your move: "))
+
+            print(f"You made dropped it at {move}. The current position of the board is: \n \n")
+            print(self.board)
+
+            if self.board.check_win() or self.board.check_draw():
+                break
+
+            bot_move = self.best_move()
+            self.board.drop_disc(bot_move+1, 2)
+
+            print(f"The bot dropped it at {bot_move+1}. The current position of the board is: \n \n")
+            print(self.board)
+
+        winner = self.board.check_win()
+
+        if winner is not None:
+            print("The winner is player" + str(winner) + "!")
+        else:
+            print("The following game ended in a draw!")
+
+    def best_move(self, time_budget: Optional[float] = None) -> int:
+        """
+        Find the best (0-indexed) column for the player to move without playing it,
+        searching for time_budget seconds, or self.time_budget if that is not given,
+        and for self.playouts playouts if neither is set. The search tree is kept for
+        the next move.
+        """
+        if self.game_over():
+            raise ValueError("the game is over")
+        if time_budget is None:
+            time_budget = self.time_budget
+        playouts = self.playouts if time_budget is None else None
+        return self.mcts.search(Bitboard(self.board.board), self.to_move(), playouts, time_budget)
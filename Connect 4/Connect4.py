@@ -13,6 +13,13 @@ class Connect4:
             self.board = [[0] * 7 for _ in range(6)]
         else:
             self.board = [row.copy() for row in board]
+        self.evaluator: Optional[IncrementalEvaluator] = None
+        self.moves_played = sum(1 for row in self.board for val in row if val)
+        self.last_move: Optional[Tuple[int, int]] = None
+        # (row, col, winner before the move) of every disc dropped, so moves can be taken back
+        self.history: List[Tuple[int, int, Optional[int]]] = []
+        # only a board handed in from outside has to be scanned, after that every drop checks its own lines
+        self.winner = self.find_winner()
 
     def __str__(self):
         rtn = ""
@@ -39,7 +46,7 @@ class Connect4:
         """
         rtn_str = ""
         for row in self.board:
-            for val in self.board:
+            for val in row:
                 rtn_str += str(val)
         return rtn_str
 
@@ -57,17 +64,79 @@ class Connect4:
             return False
         else:
             self.board[row-1][column-1] = player
+            if self.evaluator is not None:
+                self.evaluator.add(row-1, column-1, player)
+            self.moves_played += 1
+            self.last_move = (row-1, column-1)
+            self.history.append((row-1, column-1, self.winner))
+            if self.winner is None:
+                self.winner = self.check_win_at(row-1, column-1)
             return True
 
-    def check_win(self):
+    def pop_disc(self) -> Optional[int]:
+        """
+        Take back the last disc dropped with drop_disc, restoring the board exactly as
+        it was. Returns the (1-indexed) column it was in, or None if there is nothing to undo.
+        """
+        if not self.history:
+            return None
+
+        row, col, winner = self.history.pop()
+        player = self.board[row][col]
+        self.board[row][col] = 0
+        if self.evaluator is not None:
+            self.evaluator.remove(row, col, player)
+        self.moves_played -= 1
+        self.winner = winner
+        self.last_move = self.history[-1][:2] if self.history else None
+        return col + 1
+
+    def undo_move(self) -> Optional[int]:
+        """
+        Same as pop_disc.
+        """
+        return self.pop_disc()
+
+    def check_win(self) -> Optional[int]:
+        """
+        Return the player that has four in a row, or None if nobody has. The winner is
+        found as the discs are dropped, so this does not look at the board at all.
+        """
+        return self.winner
+
+    def check_win_at(self, row: int, col: int) -> Optional[int]:
+        """
+        Check the four lines through the disc at (row, col) only. Returns its player if
+        one of them has four in a row, otherwise None.
+        """
+        player = self.board[row][col]
+        if player == 0:
+            return None
+
+        for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            count = 1
+            for sign in (1, -1):
+                r, c = row + sign * d_row, col + sign * d_col
+                while 0 <= r < 6 and 0 <= c < 7 and self.board[r][c] == player:
+                    count += 1
+                    r, c = r + sign * d_row, c + sign * d_col
+            if count >= 4:
+                return player
+
+        return None
+
+    def find_winner(self) -> Optional[int]:
+        """
+        Scan the whole board for four in a row. Returns the player that has it, or None.
+        """
         def check_row(row: List[int]):
-            for index in range(len(row)-4):
+            for index in range(len(row)-3):
                 if row[index] != 0 and row[index] == row[index+1] == row[index+2] == row[index+3]:
                     return row[index]
             return None
                 
         def check_column(column: int):
-            for row in range(len(self.board)-4):
+            for row in range(len(self.board)-3):
                 if self.board[row][column] != 0 and self.board[row][column] == self.board[row+1][column] == self.board[row+2][column] == self.board[row+3][column]:
                     return self.board[row][column]
             return None
@@ -85,31 +154,22 @@ class Connect4:
 
 
         for row in self.board:
-            if check_row(row):
-                return check_row(row)
+            winner = check_row(row)
+            if winner:
+                return winner
 
-        for column in range(6):
-            if check_column(column):
-                return check_column(column)
+        for column in range(7):
+            winner = check_column(column)
+            if winner:
+                return winner
 
-        if check_diagonal():
-            return check_diagonal()
-        
-        return None
+        return check_diagonal()
     
     def check_draw(self):
         """
         Check if the game is a draw. A draw occurs when the board is full and there are no winners.
         """
-        if self.check_win():
-            return False
-        
-        for row in self.board:
-            for val in row:
-                if val == 0:
-                    return False
-                
-        return True
+        return self.winner is None and self.moves_played == 42
     
     def get_available_moves(self) -> List[int]:
         """
@@ -122,6 +182,14 @@ class Connect4:
                 lst.append(val)
         
         return lst
+
+    def track_evaluation(self) -> IncrementalEvaluator:
+        """
+        Attach an IncrementalEvaluator to the board that is kept up to date on every
+        drop_disc, so the position can be scored without rescanning it.
+        """
+        self.evaluator = IncrementalEvaluator(self.board)
+        return self.evaluator
     
     
 def evaluate_board(board: Connect4, player: int) -> int:
@@ -284,3 +352,119 @@ def evaluate_board(board: Connect4, player: int) -> int:
                 eval -= 1
 
     return eval
+
+
+
+def _evaluation_windows() -> List[List[Tuple[int, int]]]:
+    """
+    List the cells of every four-cell window that evaluate_board scores, in the exact
+    order evaluate_board visits them so that the early return on a completed window
+    picks the same one.
+    """
+    windows = []
+    for row in range(6):
+        for col in range(3):
+            windows.append([(row, col + i) for i in range(4)])
+    for col in range(7):
+        for row in range(2):
+            windows.append([(row + i, col) for i in range(4)])
+    for row in range(3, 6):
+        for col in range(4):
+            windows.append([(row - i, col + i) for i in range(4)])
+    for row in range(3):
+        for col in range(4):
+            windows.append([(row + i, col + i) for i in range(4)])
+    return windows
+
+
+EVAL_WINDOWS = _evaluation_windows()
+
+# CELL_WINDOWS[row][col] holds the index of every window in EVAL_WINDOWS that contains the cell
+CELL_WINDOWS = [[[] for _ in range(7)] for _ in range(6)]
+for _index, _window in enumerate(EVAL_WINDOWS):
+    for _row, _col in _window:
+        CELL_WINDOWS[_row][_col].append(_index)
+
+# points for a disc of player 1 in each column, player 2 gets the negative
+CENTER_WEIGHTS = [0, 1, 2, 3, 2, 1, 0]
+
+# WINDOW_SCORES[mine][theirs] for a window that does not hold four discs of one player
+WINDOW_SCORES = [[0] * 5 for _ in range(5)]
+for _count, _score in ((1, 1), (2, 10), (3, 50)):
+    WINDOW_SCORES[_count][0] = _score
+    WINDOW_SCORES[0][_count] = -_score
+
+
+class IncrementalEvaluator:
+    """
+    Keeps the evaluate_board score of a position up to date as discs are added and
+    removed. It stores how many discs each player has in every window plus the running
+    total, so a move only touches the windows through its cell and reading the score
+    is O(1). The scores are exactly those of evaluate_board.
+    """
+    def __init__(self, board: Optional[List[List[int]]] = None):
+        """
+        Initialize the evaluator, optionally with the discs of a Connect4.board.
+        """
+        self.counts = [None, [0] * len(EVAL_WINDOWS), [0] * len(EVAL_WINDOWS)]
+        self.fours = [0, 0, 0]
+        # sum of the window scores from player 1's point of view
+        self.window_score = 0
+        # the center column part of the score, which always favours player 1
+        self.center_score = 0
+
+        if board:
+            for row in range(6):
+                for col in range(7):
+                    if board[row][col]:
+                        self.add(row, col, board[row][col])
+
+    def add(self, row: int, col: int, player: int):
+        """
+        Account for a disc of player placed at (row, col).
+        """
+        mine, theirs = self.counts[player], self.counts[3 - player]
+        sign = 1 if player == 1 else -1
+        delta = 0
+        for index in CELL_WINDOWS[row][col]:
+            count = mine[index]
+            other = theirs[index]
+            delta += WINDOW_SCORES[count + 1][other] - WINDOW_SCORES[count][other]
+            mine[index] = count + 1
+            if count == 3:
+                self.fours[player] += 1
+        self.window_score += sign * delta
+        self.center_score += sign * CENTER_WEIGHTS[col]
+
+    def remove(self, row: int, col: int, player: int):
+        """
+        Take back a disc of player at (row, col), the reverse of add.
+        """
+        mine, theirs = self.counts[player], self.counts[3 - player]
+        sign = 1 if player == 1 else -1
+        delta = 0
+        for index in CELL_WINDOWS[row][col]:
+            count = mine[index]
+            other = theirs[index]
+            delta += WINDOW_SCORES[count - 1][other] - WINDOW_SCORES[count][other]
+            mine[index] = count - 1
+            if count == 4:
+                self.fours[player] -= 1
+        self.window_score += sign * delta
+        self.center_score -= sign * CENTER_WEIGHTS[col]
+
+    def evaluate(self, player: int) -> int:
+        """
+        Return evaluate_board's score of the current position for the given player.
+        """
+        if self.fours[1] or self.fours[2]:
+            # evaluate_board returns on the first completed window it visits
+            for index in range(len(EVAL_WINDOWS)):
+                if self.counts[player][index] == 4:
+                    return 1000
+                elif self.counts[3 - player][index] == 4:
+                    return -1000
+
+        if player == 1:
+            return self.center_score + self.window_score
+        return self.center_score - self.window_score
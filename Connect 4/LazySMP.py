@@ -0,0 +1,121 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from Bitboard import Bitboard
+from BookBuilder import load_bots
+from MoveOrdering import CENTER_ORDER, KillerHistoryOrderer
+from OpeningBook import OpeningBook
+from TranspositionTable import SharedTranspositionTable
+import os
+
+# the engine and shared table of each worker process, created on its first task
+_worker_bot = None
+_worker_tt: Optional[SharedTranspositionTable] = None
+
+
+class StaggeredOrderer(KillerHistoryOrderer):
+    """
+    The killer and history move ordering, but every worker breaks ties between
+    otherwise equal moves in its own order, so the workers spread out over the tree
+    instead of all searching the same lines first.
+    """
+    def __init__(self, worker: int):
+        KillerHistoryOrderer.__init__(self)
+        order = CENTER_ORDER[worker % len(CENTER_ORDER):] + CENTER_ORDER[:worker % len(CENTER_ORDER)]
+        self.center_rank = [len(order) - order.index(col) for col in range(7)]
+
+
+def _search_worker(tt_name: str, position: List[List[int]], player: int, time_budget: Optional[float],
+                   depth: Optional[int], worker: int) -> Tuple[int, Optional[int], int, int]:
+    """
+    Run one Lazy SMP worker in its own process. Returns (depth, score, move, nodes) of
+    the deepest iteration it finished.
+    """
+    global _worker_bot, _worker_tt
+    if _worker_tt is None or _worker_tt.name != tt_name:
+        if _worker_tt is not None:
+            _worker_tt.close()
+        _worker_tt = SharedTranspositionTable(name=tt_name)
+        _worker_bot = load_bots().PlayPro()
+        _worker_bot.use_book = False
+        _worker_bot.tt = _worker_tt
+        _worker_bot.shared_tt = True
+        _worker_bot.should_stop = _worker_tt.stopped
+
+    _worker_bot.orderer = StaggeredOrderer(worker)
+    # odd workers skip the first iteration so they are always one ply ahead of the even ones
+    start_depth = 1 + worker % 2
+    if depth is None:
+        move = _worker_bot.search(position, player, time_budget, start_depth=start_depth)
+    else:
+        move = _worker_bot.search(position, player, float("inf"), depth, min(start_depth, depth))
+    return _worker_bot.depth, _worker_bot.score, move, _worker_bot.nodes
+
+
+class LazySMP:
+    """
+    Searches a Connect 4 position with several processes at once. Every worker runs
+    PlayPro's iterative deepening on the same root, but with its own move ordering and
+    half of them starting one ply deeper, and they all share one transposition table in
+    shared memory. Whatever one worker finds is picked up by the others through the
+    table, so together they reach a given depth sooner than a single process would.
+    """
+    def __init__(self, workers: Optional[int] = None, tt_mb: float = 64):
+        """
+        Start the worker processes, by default one per CPU, and create a shared
+        transposition table of at most tt_mb megabytes.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.tt = SharedTranspositionTable(tt_mb)
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.use_book = True
+        # (depth, score, move, nodes) of every worker in the last search
+        self.results: List[Tuple[int, Optional[int], int, int]] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def search(self, position: List[List[int]], max_player: int, time_budget: Optional[float] = None,
+               depth: Optional[int] = None) -> int:
+        """
+        Find the best move for max_player. With a depth the first worker to finish that
+        depth decides the move and the rest are stopped. Otherwise every worker deepens
+        until time_budget seconds have passed and the deepest result wins, the one that
+        finished first if several got equally deep.
+        """
+        if depth is None and time_budget is None:
+            raise ValueError("give a depth or a time_budget")
+
+        if self.use_book:
+            book_move = OpeningBook.load().get_move(Bitboard(position))
+            if book_move is not None:
+                return book_move
+
+        self.tt.new_search()
+        futures = [self.executor.submit(_search_worker, self.tt.name, position, max_player, time_budget, depth, worker)
+                   for worker in range(self.workers)]
+        self.results = []
+        best = None
+        pending = set(futures)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                self.results.append(result)
+                if best is None or result[0] > best[0]:
+                    best = result
+            if depth is not None and best[0] >= depth and not self.tt.stopped():
+                self.tt.stop()
+
+        return best[2]
+
+    def close(self):
+        """
+        Stop the worker processes and free the shared table.
+        """
+        self.executor.shutdown()
+        self.tt.close()
@@ -0,0 +1,258 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+from Bitboard import Bitboard, WIDTH, HEIGHT, COLUMN_BITS, BOARD_MASK, COLUMN_MASKS, has_four
+from MoveOrdering import CENTER_ORDER
+import math
+import time
+import numpy as np
+
+# the exploration constant of UCT, sqrt(2) for rewards between 0 and 1
+EXPLORATION = math.sqrt(2)
+
+# the bitboard layout of Bitboard as numpy constants, per (0-indexed) column
+BOTTOM_BITS = np.array([1 << (col * COLUMN_BITS) for col in range(WIDTH)], dtype=np.uint64)
+COLUMN_BITS_MASKS = np.array(COLUMN_MASKS, dtype=np.uint64)
+TOP_CELLS = np.array([1 << (col * COLUMN_BITS + HEIGHT - 1) for col in range(WIDTH)], dtype=np.uint64)
+FULL_BOARD = np.uint64(BOARD_MASK)
+# vertical, horizontal and the two diagonals, as in Bitboard.DIRECTIONS
+SHIFTS = [(np.uint64(shift), np.uint64(2 * shift)) for shift in (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1)]
+
+
+def batch_has_four(discs: np.ndarray) -> np.ndarray:
+    """
+    Return which of an array of bitboards, in the layout of Bitboard, hold four in a row.
+    """
+    four = np.zeros(len(discs), dtype=bool)
+    for shift, double in SHIFTS:
+        pairs = discs & (discs >> shift)
+        four |= (pairs & (pairs >> double)) != 0
+    return four
+
+
+def random_playouts(current: np.ndarray, mask: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Play random games to the end from a batch of positions, given as uint64 arrays of
+    the discs of the side to move and of both players, all at the same time: every
+    step drops one random disc in every game that is still going, and the games that
+    end are dropped from the arrays. None of the positions may be over already.
+    Returns an int8 array with 1 where the side to move won, -1 where it lost and 0
+    for a draw.
+    """
+    results = np.zeros(len(current), dtype=np.int8)
+    games = np.arange(len(current))
+    current, mask = current.copy(), mask.copy()
+    sign = 1
+    while len(games):
+        # a uniformly random column among those that are not full
+        choice = rng.random((len(games), WIDTH))
+        choice[(mask[:, np.newaxis] & TOP_CELLS) != 0] = -1.0
+        cols = choice.argmax(axis=1)
+        move = (mask + BOTTOM_BITS[cols]) & COLUMN_BITS_MASKS[cols]
+
+        current |= move
+        mask |= move
+        won = batch_has_four(current)
+        results[games[won]] = sign
+        going = ~(won | (mask == FULL_BOARD))
+        # the other player is to move next
+        current, mask, games = (current ^ mask)[going], mask[going], games[going]
+        sign = -sign
+    return results
+
+
+class Node:
+    """
+    A position in the search tree, stored as the discs of the side to move and of both
+    players. wins and visits count the playouts through it, the wins from the point of
+    view of the player who made move, the one that led to it, a draw counting as half.
+    """
+    __slots__ = ("current", "mask", "move", "parent", "children", "untried", "visits", "wins", "result")
+
+    def __init__(self, current: int, mask: int, move: Optional[int] = None, parent: Optional[Node] = None,
+                 result: Optional[float] = None):
+        self.current = current
+        self.mask = mask
+        self.move = move
+        self.parent = parent
+        self.children: List[Node] = []
+        # the result for the player who made move if the game ended with it, else None
+        self.result = result
+        # popped from the end, so the center columns are expanded first
+        self.untried = [] if result is not None else \
+            [col for col in reversed(CENTER_ORDER) if not mask & (1 << (col * COLUMN_BITS + HEIGHT - 1))]
+        self.visits = 0
+        self.wins = 0.0
+
+    def key(self) -> int:
+        return self.current + self.mask
+
+    def expand(self) -> Node:
+        """
+        Add the child of the next untried move and return it.
+        """
+        col = self.untried.pop()
+        move = (self.mask + (1 << (col * COLUMN_BITS))) & COLUMN_MASKS[col]
+        mine = self.current | move
+        mask = self.mask | move
+        if has_four(mine):
+            result = 1.0
+        elif mask == BOARD_MASK:
+            result = 0.5
+        else:
+            result = None
+        child = Node(mine ^ mask, mask, col, self, result)
+        self.children.append(child)
+        return child
+
+
+class MCTS:
+    """
+    Monte Carlo Tree Search with UCT for Connect 4. Every iteration picks up to
+    batch_leaves leaves of the tree with UCT, adding a new child to each, and plays
+    playouts_per_leaf random games from every one of them in a single vectorized batch
+    (see random_playouts), so the per game cost of Python is spread over the whole
+    batch. While a batch is being collected the playouts it will run already count as
+    visits without wins, a virtual loss that spreads its leaves over the tree.
+    The tree is kept between searches: when the next search starts in a position
+    reached from the old root by one or two moves, its subtree is searched on.
+    """
+    def __init__(self, exploration: float = EXPLORATION, batch_leaves: int = 32, playouts_per_leaf: int = 8,
+                 max_nodes: int = 1000000, seed: Optional[int] = None):
+        """
+        Initialize the search. The tree stops growing at max_nodes nodes, after which
+        only the statistics of the existing nodes are updated. seed makes the playouts
+        repeatable.
+        """
+        self.exploration = exploration
+        self.batch_leaves = batch_leaves
+        self.playouts_per_leaf = playouts_per_leaf
+        self.max_nodes = max_nodes
+        self.rng = np.random.default_rng(seed)
+        self.root: Optional[Node] = None
+        self.nodes = 0
+        # statistics of the last search: playouts run, the visits the root started with
+        # and the share of playouts the chosen move won
+        self.playouts = 0
+        self.reused = 0
+        self.score: Optional[float] = None
+
+    def clear(self):
+        """
+        Forget the tree, used when a new game starts.
+        """
+        self.root = None
+        self.nodes = 0
+
+    def reseed(self, seed: Optional[int]):
+        """
+        Restart the random numbers of the playouts from seed.
+        """
+        self.rng = np.random.default_rng(seed)
+
+    def set_root(self, board: Bitboard, player: int):
+        """
+        Make the position on board with player to move the root, keeping the subtree
+        under it if it can be found at most two moves below the current root.
+        """
+        current, mask = board.boards[player], board.boards[1] | board.boards[2]
+        key = current + mask
+        found = None
+        if self.root is not None:
+            candidates = [self.root] + self.root.children + [child for node in self.root.children for child in node.children]
+            found = next((node for node in candidates if node.key() == key), None)
+        if found is None:
+            self.root = Node(current, mask)
+            self.nodes = 1
+        else:
+            found.parent = None
+            found.move = None
+            self.root = found
+            self.nodes = count_nodes(found)
+
+    def search(self, board: Bitboard, player: int, playouts: Optional[int] = 10000,
+               time_budget: Optional[float] = None) -> int:
+        """
+        Search the position on board with player to move, which must not be over, until
+        playouts random games have been played or time_budget seconds have passed,
+        whichever comes first (at least one must be given), but at least one batch.
+        Returns the (0-indexed) column that was visited the most.
+        """
+        if playouts is None and time_budget is None:
+            raise ValueError("give a number of playouts or a time_budget")
+        start = time.perf_counter()
+        self.set_root(board, player)
+        root = self.root
+        self.reused = root.visits
+        self.playouts = 0
+
+        # at least one batch, so the root has a child to choose even with no time left
+        self.playouts += self.run_batch(root)
+        while (playouts is None or self.playouts < playouts) and \
+                (time_budget is None or time.perf_counter() - start < time_budget):
+            self.playouts += self.run_batch(root)
+
+        best = max(root.children, key=lambda child: child.visits)
+        self.score = best.wins / best.visits
+        return best.move
+
+    def run_batch(self, root: Node) -> int:
+        """
+        Select a batch of leaves, play out their positions and back the results up the
+        tree. Returns the number of playouts that were added.
+        """
+        exploration = self.exploration
+        per_leaf = self.playouts_per_leaf
+        leaves = []
+        for _ in range(self.batch_leaves):
+            node = root
+            node.visits += per_leaf
+            while node.result is None and not node.untried and node.children:
+                log_visits = math.log(node.visits)
+                node = max(node.children, key=lambda child: child.wins / child.visits +
+                           exploration * math.sqrt(log_visits / child.visits))
+                node.visits += per_leaf
+            if node.result is None and node.untried and self.nodes < self.max_nodes:
+                node = node.expand()
+                node.visits += per_leaf
+                self.nodes += 1
+            leaves.append(node)
+
+        # terminal leaves need no playouts, the others are played out together
+        playing = [leaf for leaf in leaves if leaf.result is None]
+        rewards = []
+        if playing:
+            current = np.repeat(np.array([leaf.current for leaf in playing], dtype=np.uint64), per_leaf)
+            mask = np.repeat(np.array([leaf.mask for leaf in playing], dtype=np.uint64), per_leaf)
+            results = random_playouts(current, mask, self.rng).reshape(len(playing), per_leaf).sum(axis=1, dtype=np.int64)
+            # the results are for the side to move at the leaf, the rewards for the player who moved into it
+            rewards = [(per_leaf - result) / 2 for result in results.tolist()]
+        rewards.reverse()
+
+        for leaf in leaves:
+            reward = leaf.result * per_leaf if leaf.result is not None else rewards.pop()
+            node = leaf
+            while node is not None:
+                node.wins += reward
+                reward = per_leaf - reward
+                node = node.parent
+        return len(leaves) * per_leaf
+
+    def move_statistics(self) -> List[Tuple[int, int, float]]:
+        """
+        (column, visits, share of playouts won) of every move of the root, the most
+        visited first.
+        """
+        if self.root is None:
+            return []
+        return sorted(((child.move, child.visits, child.wins / child.visits) for child in self.root.children if child.visits),
+                      key=lambda entry: -entry[1])
+
+
+def count_nodes(node: Node) -> int:
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.children)
+    return count
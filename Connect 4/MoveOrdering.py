@@ -0,0 +1,130 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+from Bitboard import Bitboard, COLUMN_BITS
+
+# columns from the center outwards, ties going to the left like the rest of the engine
+CENTER_ORDER = [3, 2, 4, 1, 5, 0, 6]
+# CENTER_RANK[col] is higher the closer col is to the center
+CENTER_RANK = [len(CENTER_ORDER) - CENTER_ORDER.index(col) for col in range(7)]
+
+MAX_PLY = 43
+
+
+class MoveOrderer:
+    """
+    Decides in which order the search tries the moves of a position. The better the
+    first move, the more often alpha-beta can cut the rest off. This base class tries
+    the transposition table move first and the other columns from left to right, the
+    order the search has always used. It also keeps count of how many nodes were
+    searched, how many of them were cut off and how many of those cutoffs came from
+    the first move tried.
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """
+        Called at the start of every search. Resets the statistics.
+        """
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def order(self, board: Bitboard, moves: List[int], ply: int, player: int, tt_move: Optional[int]) -> List[int]:
+        """
+        Return the moves of a position in the order they should be searched.
+        """
+        self.nodes += 1
+        if tt_move is not None and tt_move != moves[0] and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+    def cutoff(self, board: Bitboard, move: int, ply: int, player: int, depth: int, index: int):
+        """
+        Called when move, the index-th move tried, caused a beta cutoff. The move has
+        already been taken back, so board is the position it was played in.
+        """
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+    def first_move_cutoff_rate(self) -> float:
+        """
+        The share of cutoffs that came from the first move tried.
+        """
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the statistics of the last search.
+        """
+        return {
+            "nodes": self.nodes,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoffs": self.first_move_cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoff_rate(),
+        }
+
+
+class CenterOrderer(MoveOrderer):
+    """
+    Tries the transposition table move first and then the columns from the center
+    outwards, since central discs take part in the most four in a rows.
+    """
+    def order(self, board: Bitboard, moves: List[int], ply: int, player: int, tt_move: Optional[int]) -> List[int]:
+        self.nodes += 1
+        ordered = [col for col in CENTER_ORDER if col in moves]
+        if tt_move is not None and tt_move != ordered[0] and tt_move in ordered:
+            ordered.remove(tt_move)
+            ordered.insert(0, tt_move)
+        return ordered
+
+
+class KillerHistoryOrderer(MoveOrderer):
+    """
+    Tries the transposition table move first, then the killer moves (the last two
+    moves that caused a cutoff at the same ply), then the rest by their history score,
+    which grows every time the move caused a cutoff in the same cell for the same
+    player. Ties are broken from the center outwards.
+    """
+    def __init__(self):
+        MoveOrderer.__init__(self)
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        # history[player][bit] for every cell of the bitboard layout
+        self.history = [[0] * 49 for _ in range(3)]
+        # how moves that are equal otherwise are ranked, higher first
+        self.center_rank = CENTER_RANK
+
+    def new_search(self):
+        """
+        Called at the start of every search. Killers are forgotten and the history
+        scores are halved so that the current position weighs the most.
+        """
+        MoveOrderer.new_search(self)
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        for scores in self.history:
+            for index in range(len(scores)):
+                scores[index] >>= 1
+
+    def order(self, board: Bitboard, moves: List[int], ply: int, player: int, tt_move: Optional[int]) -> List[int]:
+        self.nodes += 1
+        killers = self.killers[ply]
+        history = self.history[player]
+        heights = board.heights
+        center_rank = self.center_rank
+
+        def priority(col: int):
+            return (col == tt_move, col in killers, history[col * COLUMN_BITS + heights[col]], center_rank[col])
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def cutoff(self, board: Bitboard, move: int, ply: int, player: int, depth: int, index: int):
+        MoveOrderer.cutoff(self, board, move, ply, player, depth, index)
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        self.history[player][move * COLUMN_BITS + board.heights[move]] += depth * depth
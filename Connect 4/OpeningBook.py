@@ -0,0 +1,210 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Tuple
+from Bitboard import Bitboard, mirror_bits, mirror_column
+import json
+import mmap
+import os
+import struct
+import sys
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+JSON_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.json")
+
+MAGIC = b"C4BOOK2\0"
+# books written before positions were stored once for them and their mirror image, with both keys
+OLD_MAGIC = b"C4BOOK1\0"
+# every record is the canonical position key (see Bitboard.canonical_key) followed by the move byte
+RECORD = struct.Struct("<QB")
+KEY = struct.Struct("<Q")
+# the depth a position is searched to when the JSON book gives it and its mirror image different moves,
+# the one BookBuilder searches at by default
+CONFLICT_DEPTH = 9
+
+# books that have already been mapped in this process, by path
+_open_books: Dict[str, OpeningBook] = {}
+
+
+def key_from_serialized(serialized: str) -> int:
+    """
+    Convert a 42 character Connect4.serialize string (the format used by
+    opening_book.json) into a packed position key.
+    """
+    board = [[int(serialized[row * 7 + col]) for col in range(7)] for row in range(6)]
+    return Bitboard(board).key()
+
+
+def canonical_entry(key: int, move: int) -> Tuple[int, int]:
+    """
+    The (key, move) that stands for a position and its mirror image in a book: the
+    smaller of the two keys, with the move mirrored if that is the mirror image's.
+    """
+    mirrored = mirror_bits(key)
+    return (mirrored, mirror_column(move)) if mirrored < key else (key, move)
+
+
+class OpeningBook:
+    """
+    A read only opening book stored as a sorted array of fixed size records and memory
+    mapped from disk, so opening it costs nothing up front and only the pages that a
+    lookup touches are ever read. A position and its mirror image share one record
+    under their canonical key. Use OpeningBook.load to share one mapping per process.
+    """
+    def __init__(self, path: str):
+        """
+        Map the book at path. A missing or empty file gives an empty book.
+        """
+        self.path = path
+        self.count = 0
+        # old books hold every position under its own key instead of the canonical one
+        self.canonical = True
+        self._file = None
+        self._map = None
+
+        if os.path.exists(path) and os.path.getsize(path) > len(MAGIC):
+            self._file = open(path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(MAGIC)] not in (MAGIC, OLD_MAGIC):
+                raise ValueError(f"{path} is not an opening book")
+            self.canonical = self._map[:len(MAGIC)] == MAGIC
+            self.count = (len(self._map) - len(MAGIC)) // RECORD.size
+
+    @classmethod
+    def load(cls, path: str = BOOK_PATH) -> OpeningBook:
+        """
+        Return the book at path, mapping it on the first call only.
+        """
+        book = _open_books.get(path)
+        if book is None:
+            book = _open_books[path] = cls(path)
+        return book
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, key: int) -> Optional[int]:
+        """
+        Find the move stored for a packed position key with a binary search, as it is
+        stored. Returns None if the position is not in the book.
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            stored = KEY.unpack_from(self._map, len(MAGIC) + middle * RECORD.size)[0]
+            if stored < key:
+                low = middle + 1
+            elif stored > key:
+                high = middle
+            else:
+                return self._map[len(MAGIC) + middle * RECORD.size + KEY.size]
+        return None
+
+    def get_move(self, board: Bitboard) -> Optional[int]:
+        """
+        Find the move stored for a position, mirrored back if the book holds its mirror
+        image. Returns None if it is not in the book.
+        """
+        if not self.canonical:
+            return self.lookup(board.key())
+        key, mirrored = board.canonical_key()
+        move = self.lookup(key)
+        if move is not None and mirrored:
+            return mirror_column(move)
+        return move
+
+    def close(self):
+        """
+        Unmap the book.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+            self.count = 0
+        _open_books.pop(self.path, None)
+
+
+def write_book(path: str, entries: Iterable[Tuple[int, int]]):
+    """
+    Write (key, move) pairs as a binary book. Every position is stored once under its
+    canonical key, entries are sorted by key, and when a position or its mirror image
+    is given more than once the last move wins.
+    """
+    moves = dict(canonical_entry(key, move) for key, move in entries)
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+        for key in sorted(moves):
+            file.write(RECORD.pack(key, moves[key]))
+
+
+def read_book(path: str) -> List[Tuple[int, int]]:
+    """
+    Read every (key, move) pair of a binary book.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:len(MAGIC)] not in (MAGIC, OLD_MAGIC):
+        raise ValueError(f"{path} is not an opening book")
+    return list(RECORD.iter_unpack(data[len(MAGIC):]))
+
+
+def resolve_mirror_conflicts(opening_book: Dict[str, int], depth: int = CONFLICT_DEPTH) -> List[Tuple[int, int]]:
+    """
+    Turn a JSON book into (key, move) pairs with one move per position and mirror
+    image. When the book holds both and their moves are not mirror images of each
+    other, both moves are searched to depth and the one that scores higher is kept.
+    """
+    # canonical key -> (the position as the key stores it, the moves given for it in that orientation)
+    entries: Dict[int, Tuple[Bitboard, List[int]]] = {}
+    for serialized, move in opening_book.items():
+        board = Bitboard([[int(serialized[row * 7 + col]) for col in range(7)] for row in range(6)])
+        key, mirrored = board.canonical_key()
+        if mirrored:
+            board, move = board.mirrored(), mirror_column(move)
+        entries.setdefault(key, (board, []))[1].append(move)
+
+    bot = None
+    resolved = []
+    for key, (board, candidates) in entries.items():
+        moves = sorted(set(candidates))
+        if len(moves) > 1:
+            if bot is None:
+                import BookBuilder
+                bot = BookBuilder.load_bots().PlayPro()
+                bot.use_book = False
+            moves = [max(moves, key=lambda move: _move_score(bot, board, move, depth))]
+        resolved.append((key, moves[0]))
+    return resolved
+
+
+def _move_score(bot, board: Bitboard, move: int, depth: int) -> int:
+    """
+    Score move on board for the side to move with PlayPro bot, by searching the
+    position after it to depth - 1.
+    """
+    board = board.copy()
+    player = 1 if board.moves_played() % 2 == 0 else 2
+    board.play(move, player)
+    if board.check_win() == player:
+        return 1000
+    bot.minimax(board.to_board(), depth - 1, 3 - player)
+    return -bot.score
+
+
+def convert_json_book(json_path: str = JSON_BOOK_PATH, book_path: str = BOOK_PATH, depth: int = CONFLICT_DEPTH) -> int:
+    """
+    Convert a JSON opening book keyed by Connect4.serialize strings into the binary
+    format, storing every position once for it and its mirror image (see
+    resolve_mirror_conflicts). The JSON book itself is left as it is. Returns the
+    number of positions written.
+    """
+    with open(json_path, "r") as file:
+        opening_book = json.load(file)
+    entries = resolve_mirror_conflicts(opening_book, depth)
+    write_book(book_path, entries)
+    return len(entries)
+
+
+if __name__ == "__main__":
+    # python OpeningBook.py [opening_book.json] [opening_book.bin]
+    count = convert_json_book(*sys.argv[1:3])
+    print(f"Converted {count} positions")
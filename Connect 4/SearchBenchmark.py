@@ -0,0 +1,64 @@
+from __future__ import annotations
+from typing import List, Tuple
+from BookBuilder import load_bots
+from Connect4 import Connect4
+import argparse
+import random
+import time
+
+
+def random_positions(count: int, seed: int = 21, min_moves: int = 4, max_moves: int = 16) -> List[Tuple[List[List[int]], int]]:
+    """
+    Play random games to get count positions that are not over yet. Returns a list
+    of (board, player to move).
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        game = Connect4()
+        player = 1
+        for _ in range(rng.randint(min_moves, max_moves)):
+            game.drop_disc(rng.choice(game.get_available_moves()) + 1, player)
+            player = 3 - player
+            if game.check_win() is not None:
+                break
+        if game.check_win() is None and not game.check_draw():
+            positions.append((game.board, player))
+    return positions
+
+
+def compare_algorithms(positions: List[Tuple[List[List[int]], int]], depth: int):
+    """
+    Search every position with PlayPro.minimax to the same depth with each of
+    PlayPro's algorithms and print the nodes and time they needed, and whether they
+    agree with plain minimax on the score and the best move.
+    """
+    bots = load_bots()
+    reference = None
+
+    for algorithm in (bots.MINIMAX, bots.PVS, bots.MTDF):
+        nodes, seconds, results = 0, 0.0, []
+        for board, player in positions:
+            bot = bots.PlayPro(algorithm=algorithm)
+            bot.use_book = False
+            start = time.perf_counter()
+            move = bot.minimax(board, depth, player)
+            seconds += time.perf_counter() - start
+            nodes += bot.nodes
+            results.append((bot.score, move))
+
+        if reference is None:
+            reference = results
+        same_scores = sum(result[0] == expected[0] for result, expected in zip(results, reference))
+        same_moves = sum(result[1] == expected[1] for result, expected in zip(results, reference))
+        print(f"{algorithm:8} {nodes:9} nodes {seconds:7.2f}s   same score {same_scores}/{len(positions)}   "
+              f"same move {same_moves}/{len(positions)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare PlayPro's search algorithms.")
+    parser.add_argument("--depth", type=int, default=7)
+    parser.add_argument("--positions", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=21)
+    args = parser.parse_args()
+    compare_algorithms(random_positions(args.positions, args.seed), args.depth)
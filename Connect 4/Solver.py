@@ -0,0 +1,223 @@
+from __future__ import annotations
+from typing import Callable, Dict, Optional, Tuple
+from Bitboard import Bitboard, WIDTH, HEIGHT, COLUMN_BITS, BOTTOM_MASK, BOARD_MASK, COLUMN_MASKS, mirror_bits
+from MoveOrdering import CENTER_ORDER
+
+CELLS = WIDTH * HEIGHT
+
+
+class SolveTimeout(Exception):
+    """
+    Raised inside the solver when it was told to stop. Its table stays valid.
+    """
+
+
+def winning_cells(position: int, mask: int) -> int:
+    """
+    The empty cells that would give the player whose discs are position four in a row,
+    whether they can be played right now or not. mask holds the discs of both players.
+    """
+    # vertical: three discs right below
+    cells = (position << 1) & (position << 2) & (position << 3)
+    for shift in (COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1):
+        pair = (position << shift) & (position << 2 * shift)
+        cells |= pair & (position << 3 * shift)
+        cells |= pair & (position >> shift)
+        pair = (position >> shift) & (position >> 2 * shift)
+        cells |= pair & (position << shift)
+        cells |= pair & (position >> 3 * shift)
+    return cells & (BOARD_MASK ^ mask)
+
+
+def playable(mask: int) -> int:
+    """
+    The cell every column that is not full would take its next disc in.
+    """
+    return (mask + BOTTOM_MASK) & BOARD_MASK
+
+
+def column_of(move: int) -> int:
+    return (move.bit_length() - 1) // COLUMN_BITS
+
+
+class Solver:
+    """
+    Solves Connect 4 positions exactly, to the end of the game, which is quick once few
+    cells are left. Scores are from the side to move's point of view and tell the
+    distance to the result: a position the side to move wins with e empty cells left
+    after its winning move scores e + 1, a loss scores the negative of what the winner
+    would get and a draw scores 0.
+
+    The search is a negamax on two integers per position (the discs of the side to
+    move and of both players) that never looks at a lost position: a side that can win
+    at once does so, a side that has to block an immediate win only tries that move,
+    and moves that let the opponent win right above them are never made. That keeps
+    the bounds tight enough to close the window before any move is tried in many
+    positions. The exact score is found with a series of null window searches, and a
+    weak solve only finds out whether the position is won, drawn or lost. Bounds are
+    kept in a table across calls, since they hold for a position wherever it comes up.
+    Positions missing from it are looked up in the tablebase, if one is given.
+    """
+    def __init__(self, max_entries: int = 2000000, tablebase=None):
+        # position key -> (lower bound, upper bound)
+        self.table: Dict[int, Tuple[int, int]] = {}
+        self.max_entries = max_entries
+        # a TableBase of solved positions, or None
+        self.tablebase = tablebase
+        self.nodes = 0
+
+    def solve(self, board: Bitboard, player: int, weak: bool = False,
+              should_stop: Optional[Callable[[], bool]] = None) -> Tuple[int, int]:
+        """
+        Solve the position on board with player to move, which must not be over yet.
+        Returns (score, column), the score as described for the class and a
+        (0-indexed) column that reaches it. A weak solve gives 1, 0 or -1 for a won,
+        drawn or lost position. If should_stop is given it is checked every few
+        thousand nodes and SolveTimeout is raised once it returns True.
+        """
+        if len(self.table) > self.max_entries:
+            self.table.clear()
+        self.nodes = 0
+        current, mask = board.boards[player], board.boards[1] | board.boards[2]
+        empty = CELLS - mask.bit_count()
+        negamax = self.make_negamax(should_stop)
+
+        wins = winning_cells(current, mask) & playable(mask)
+        if wins:
+            return (1 if weak else empty), column_of(wins & -wins)
+
+        non_losing = self.non_losing_moves(current, mask)
+        if not non_losing:
+            # lost whatever happens: block one of the wins if there is a way to
+            threats = winning_cells(current ^ mask, mask) & playable(mask)
+            move = threats & -threats if threats else playable(mask) & -playable(mask)
+            return (-1 if weak else -(empty - 1)), column_of(move)
+
+        if weak:
+            low, high = -1, 1
+        else:
+            low, high = -(empty - 1), max(empty - 2, 0)
+        # narrow the window down with null window searches, trying the side of 0 first
+        while low < high:
+            middle = low + (high - low) // 2
+            if middle <= 0 and -(-low // 2) < middle:
+                middle = -(-low // 2)
+            elif middle >= 0 and high // 2 > middle:
+                middle = high // 2
+            result = negamax(current, mask, empty, middle, middle + 1)
+            # the search is fail soft, so keep its bound inside the window, which matters for a weak solve
+            result = max(low, min(high, result))
+            if result <= middle:
+                high = result
+            else:
+                low = result
+        score = low
+        moves = self.ordered_moves(current, mask, non_losing)
+        if weak and score < 0:
+            # a weak solve does not tell which loss lasts longest
+            return score, column_of(moves[0])
+
+        # the first move whose position is no better than -score for the opponent
+        for move in moves:
+            if -negamax(current ^ mask, mask | move, empty - 1, -score, -score + 1) >= score:
+                return score, column_of(move)
+        raise AssertionError("no move reaches the solved score")
+
+    @staticmethod
+    def non_losing_moves(current: int, mask: int) -> int:
+        """
+        The moves of the side to move, as bits, that do not let the opponent win on the
+        next move. Only valid when the side to move can not win at once.
+        """
+        possible = playable(mask)
+        threats = winning_cells(current ^ mask, mask)
+        forced = possible & threats
+        if forced:
+            if forced & (forced - 1):
+                # two immediate threats can not both be blocked
+                return 0
+            possible = forced
+        # never play right below a cell the opponent wins in
+        return possible & ~(threats >> 1)
+
+    @staticmethod
+    def ordered_moves(current: int, mask: int, moves: int):
+        """
+        Order moves by how many cells they make winning for the side to move, the
+        columns from the center outwards on ties.
+        """
+        candidates = []
+        for rank, col in enumerate(CENTER_ORDER):
+            move = moves & COLUMN_MASKS[col]
+            if move:
+                candidates.append((-winning_cells(current | move, mask | move).bit_count(), rank, move))
+        candidates.sort()
+        return [move for _, _, move in candidates]
+
+    def make_negamax(self, should_stop: Optional[Callable[[], bool]] = None):
+        """
+        Build negamax(current, mask, empty, alpha, beta) for positions where the side to
+        move can not win at once. It returns the score if it lies inside the window, an
+        upper bound of it that is at most alpha, or a lower bound that is at least beta.
+        """
+        table = self.table
+        tablebase = self.tablebase
+        tablebase_cells = tablebase.cells if tablebase is not None else -1
+        non_losing_moves = self.non_losing_moves
+        ordered_moves = self.ordered_moves
+        solver = self
+
+        def negamax(current: int, mask: int, empty: int, alpha: int, beta: int) -> int:
+            solver.nodes += 1
+            if not solver.nodes & 4095 and should_stop is not None and should_stop():
+                raise SolveTimeout
+            if empty == 0:
+                return 0
+
+            moves = non_losing_moves(current, mask)
+            if not moves:
+                # the opponent wins with its next move
+                return -(empty - 1)
+            if empty <= 2:
+                # the opponent can not win with the last cell, the side to move can not either
+                return 0
+
+            # the opponent can not win with its next move, so at best it wins with the one after
+            lower = -(empty - 3)
+            # the side to move can not win now, so at best it wins with its next move
+            upper = empty - 2
+            key = current + mask
+            entry = table.get(key)
+            if entry is not None:
+                lower, upper = max(lower, entry[0]), min(upper, entry[1])
+            elif empty <= tablebase_cells:
+                mirrored = mirror_bits(key)
+                score = tablebase.lookup(mirrored if mirrored < key else key)
+                if score is not None:
+                    table[key] = (score, score)
+                    return score
+            if lower >= beta or lower == upper:
+                return lower
+            if upper <= alpha:
+                return upper
+            alpha, beta = max(alpha, lower), min(beta, upper)
+            alpha_start = alpha
+
+            best = -CELLS
+            for move in ordered_moves(current, mask, moves):
+                score = -negamax(current ^ mask, mask | move, empty - 1, -beta, -alpha)
+                if score > best:
+                    best = score
+                if score >= beta:
+                    table[key] = (max(lower, score), upper)
+                    return score
+                if score > alpha:
+                    alpha = score
+
+            if best <= alpha_start:
+                table[key] = (lower, min(upper, best))
+            else:
+                table[key] = (best, best)
+            return best
+
+        return negamax
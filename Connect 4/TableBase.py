@@ -0,0 +1,249 @@
+from __future__ import annotations
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Bitboard import Bitboard, WIDTH, COLUMN_BITS, mirror_bits
+from Solver import Solver, winning_cells, playable
+import argparse
+import mmap
+import os
+import random
+import struct
+
+TABLEBASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "endgame_tablebase.bin")
+
+MAGIC = b"C4TBASE1"
+# the number of slots (a power of two), the number of positions and the most empty cells of one
+HEADER = struct.Struct("<QQB7x")
+# every slot is a position key (0 for an empty slot) and its Solver score
+SLOT = struct.Struct("<Qb")
+
+# Fibonacci hashing: the top bits of the key times 2 ** 64 / golden ratio pick the slot
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+WORD_MASK = (1 << 64) - 1
+
+# tablebases that have already been mapped in this process, by path
+_open_tablebases: Dict[str, TableBase] = {}
+
+
+def position_key(current: int, mask: int) -> int:
+    """
+    The key of a position, given as the discs of the side to move and of both players,
+    shared with its mirror image: the smaller of the Solver table keys of the two.
+    """
+    key = current + mask
+    mirrored = mirror_bits(key)
+    return mirrored if mirrored < key else key
+
+
+class TableBase:
+    """
+    A read only table of solved Connect 4 endgames, memory mapped from disk like the
+    opening book. The positions are stored in an open addressing hash table of fixed
+    size slots, so a lookup reads one or two slots instead of searching the file. The
+    scores are those of Solver: from the side to move's point of view, e + 1 for a win
+    with e empty cells left after the winning move, minus that of the winner for a loss
+    and 0 for a draw. Use TableBase.load to share one mapping per process.
+    """
+    def __init__(self, path: str):
+        """
+        Map the tablebase at path. A missing or empty file gives an empty tablebase.
+        """
+        self.path = path
+        self.count = 0
+        self.slots = 0
+        # the most empty cells of any stored position, -1 when nothing is stored
+        self.cells = -1
+        self._file = None
+        self._map = None
+
+        if os.path.exists(path) and os.path.getsize(path) > len(MAGIC):
+            self._file = open(path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not an endgame tablebase")
+            self.slots, self.count, self.cells = HEADER.unpack_from(self._map, len(MAGIC))
+            self.shift = 64 - (self.slots.bit_length() - 1)
+            if not self.count:
+                self.cells = -1
+
+    @classmethod
+    def load(cls, path: str = TABLEBASE_PATH) -> TableBase:
+        """
+        Return the tablebase at path, mapping it on the first call only.
+        """
+        tablebase = _open_tablebases.get(path)
+        if tablebase is None:
+            tablebase = _open_tablebases[path] = cls(path)
+        return tablebase
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, key: int) -> Optional[int]:
+        """
+        Find the score stored for a key from position_key, following the slots from
+        the one the key hashes to until it or an empty slot is found.
+        """
+        if not self.count:
+            return None
+        offset = len(MAGIC) + HEADER.size
+        index = (key * HASH_MULTIPLIER & WORD_MASK) >> self.shift
+        mask = self.slots - 1
+        while True:
+            stored, score = SLOT.unpack_from(self._map, offset + index * SLOT.size)
+            if stored == key:
+                return score
+            if stored == 0:
+                return None
+            index = (index + 1) & mask
+
+    def probe(self, current: int, mask: int) -> Optional[int]:
+        """
+        Find the Solver score of a position, given as the discs of the side to move and
+        of both players. Returns None if it is not stored.
+        """
+        return self.lookup(position_key(current, mask))
+
+    def entries(self) -> Iterator[Tuple[int, int]]:
+        """
+        Every stored (key, score) pair, in slot order.
+        """
+        offset = len(MAGIC) + HEADER.size
+        for key, score in SLOT.iter_unpack(self._map[offset:offset + self.slots * SLOT.size]):
+            if key:
+                yield key, score
+
+    def close(self):
+        """
+        Unmap the tablebase.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+            self.count = 0
+            self.cells = -1
+        _open_tablebases.pop(self.path, None)
+
+
+def write_tablebase(path: str, scores: Dict[int, int], cells: int):
+    """
+    Write position_key -> score pairs as a tablebase of positions with at most cells
+    empty cells. The hash table gets at least twice as many slots as there are
+    positions, so lookups seldom have to go past the first slot.
+    """
+    slots = 1
+    while slots < 2 * len(scores):
+        slots *= 2
+    shift = 64 - (slots.bit_length() - 1)
+    table = bytearray(slots * SLOT.size)
+    for key, score in scores.items():
+        index = (key * HASH_MULTIPLIER & WORD_MASK) >> shift
+        while struct.unpack_from("<Q", table, index * SLOT.size)[0]:
+            index = (index + 1) & (slots - 1)
+        SLOT.pack_into(table, index * SLOT.size, key, score)
+    with open(path, "wb") as file:
+        file.write(MAGIC + HEADER.pack(slots, len(scores), cells))
+        file.write(table)
+
+
+def sample_position(rng: random.Random, cells: int) -> Optional[Tuple[Bitboard, int]]:
+    """
+    Play random moves from the empty board, never one that lets the opponent win at
+    once, until cells empty cells are left. Returns the position and the player to move,
+    or None if the game was decided before that.
+    """
+    board = Bitboard()
+    player = 1
+    while 42 - board.moves_played() > cells:
+        current, mask = board.boards[player], board.boards[1] | board.boards[2]
+        moves = Solver.non_losing_moves(current, mask)
+        if winning_cells(current, mask) & playable(mask) or not moves:
+            return None
+        board.play(rng.choice([col for col in range(WIDTH) if moves >> (col * COLUMN_BITS) & 0x3F]), player)
+        player = 3 - player
+    return board, player
+
+
+def solve_positions(boards: Iterable[List[List[int]]]) -> Dict[int, int]:
+    """
+    Solve positions to the end in a worker process. Returns the scores of the positions
+    and of every position below them whose score the solver found exactly, by
+    position_key.
+    """
+    scores = {}
+    for grid in boards:
+        board = Bitboard(grid)
+        player = 1 if board.moves_played() % 2 == 0 else 2
+        if board.check_win() is not None or board.is_full():
+            continue
+        solver = Solver()
+        score, _ = solver.solve(board, player)
+        scores[position_key(board.boards[player], board.boards[1] | board.boards[2])] = score
+        # the solver table holds bounds of every position it searched, some of them exact
+        for key, (lower, upper) in solver.table.items():
+            if lower == upper:
+                mirrored = mirror_bits(key)
+                scores[mirrored if mirrored < key else key] = lower
+    return scores
+
+
+def sample_and_solve(seed: int, games: int, cells: int) -> Dict[int, int]:
+    """
+    Solve the positions of games random games in a worker process, see sample_position.
+    """
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(games):
+        sampled = sample_position(rng, cells)
+        if sampled is not None:
+            boards.append(sampled[0].to_board())
+    return solve_positions(boards)
+
+
+def build_tablebase(cells: int = 12, games: int = 20000, seed: int = 0, workers: Optional[int] = None,
+                    output: str = TABLEBASE_PATH, merge: bool = True, positions: Optional[List[Bitboard]] = None,
+                    chunk: int = 500) -> int:
+    """
+    Build the tablebase from the positions with cells empty cells of games random
+    games, and from the given positions, for example those of recorded games, solving
+    them across a pool of worker processes. Besides every such position, the positions
+    below it that the solver finds an exact score for are stored too. The positions of
+    the tablebase at output are kept unless merge is False. Returns the number of
+    positions stored.
+    """
+    scores: Dict[int, int] = {}
+    if merge and os.path.exists(output):
+        old = TableBase(output)
+        scores.update(old.entries())
+        cells = max(cells, old.cells)
+        old.close()
+
+    with ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(sample_and_solve, seed * 1000003 + start, min(chunk, games - start), cells)
+                   for start in range(0, games, chunk)]
+        if positions:
+            boards = [board.to_board() for board in positions]
+            futures += [executor.submit(solve_positions, boards[start:start + chunk]) for start in range(0, len(boards), chunk)]
+        for done, future in enumerate(as_completed(futures), 1):
+            scores.update(future.result())
+            print(f"Solved {done}/{len(futures)} batches, {len(scores)} positions")
+
+    # release this process's mapping of the old tablebase before it is overwritten
+    TableBase.load(output).close()
+    write_tablebase(output, scores, cells)
+    return len(scores)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Connect 4 endgame tablebase.")
+    parser.add_argument("--cells", type=int, default=12, help="empty cells of the positions to solve")
+    parser.add_argument("--games", type=int, default=20000, help="number of random games to take positions from")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--output", default=TABLEBASE_PATH, help="tablebase file to write")
+    parser.add_argument("--replace", action="store_true", help="do not keep the positions already in the tablebase")
+    args = parser.parse_args()
+
+    count = build_tablebase(args.cells, args.games, args.seed, args.workers, args.output, not args.replace)
+    print(f"The tablebase now holds {count} positions")
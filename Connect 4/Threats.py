@@ -0,0 +1,69 @@
+from __future__ import annotations
+from typing import Callable, List, Tuple
+from Bitboard import Bitboard, BOTTOM_MASK, COLUMN_MASKS
+from Solver import Solver, winning_cells, playable, column_of
+
+# the outcomes of threat_analysis
+WIN, LOSS, OPEN = 1, -1, 0
+
+# rows 1, 3 and 5 counted from the bottom, and rows 2, 4 and 6
+ODD_ROWS = BOTTOM_MASK * 0b010101
+EVEN_ROWS = BOTTOM_MASK * 0b101010
+
+# points for a threat on a row of the right parity for its player: odd for the first
+# player and even for the second, who get those cells when the board fills up
+PARITY_BONUS = 80
+
+
+def threat_analysis(current: int, mask: int) -> Tuple[int, int]:
+    """
+    Look at the immediate threats of a position, given as the discs of the side to move
+    and of both players, before any move is searched. Returns (WIN, column) if the side
+    to move can win at once, (LOSS, column) if whatever it plays the opponent wins with
+    its next move (column blocks one of its wins if there is a way to), and otherwise
+    (OPEN, moves): the moves, as bits, that do not lose at once, which is just the block
+    when the opponent threatens to win and never a cell right below an opponent's win.
+    """
+    possible = playable(mask)
+    wins = winning_cells(current, mask) & possible
+    if wins:
+        return WIN, column_of(wins & -wins)
+    moves = Solver.non_losing_moves(current, mask)
+    if not moves:
+        threats = winning_cells(current ^ mask, mask) & possible
+        move = threats & -threats if threats else possible & -possible
+        return LOSS, column_of(move)
+    return OPEN, moves
+
+
+def safe_columns(moves: int, columns: List[int]) -> List[int]:
+    """
+    The columns, in the order given, that hold one of the moves from threat_analysis.
+    """
+    return [col for col in columns if moves & COLUMN_MASKS[col]]
+
+
+def threat_parity(first: int, second: int, mask: int) -> int:
+    """
+    Score the threats of both players by their row, from the first player's point of
+    view. A threat that can not be played yet only wins if its player gets that cell,
+    and when the other columns fill up the first player gets the odd rows and the
+    second the even ones, so those threats are worth PARITY_BONUS each.
+    """
+    empty_below = ~playable(mask)
+    first_threats = winning_cells(first, mask) & empty_below & ODD_ROWS
+    second_threats = winning_cells(second, mask) & empty_below & EVEN_ROWS
+    return PARITY_BONUS * (first_threats.bit_count() - second_threats.bit_count())
+
+
+def with_threat_parity(board: Bitboard, evaluate: Callable[[int], int]) -> Callable[[int], int]:
+    """
+    Add threat_parity to the scores of a position evaluation function of board.
+    """
+    boards = board.boards
+
+    def evaluate_with_parity(player: int) -> int:
+        parity = threat_parity(boards[1], boards[2], boards[1] | boards[2])
+        return evaluate(player) + (parity if player == 1 else -parity)
+
+    return evaluate_with_parity
@@ -0,0 +1,222 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+from multiprocessing import shared_memory
+import random
+
+# fixed seed so hashes (and therefore search results) are the same on every run
+_rng = random.Random(0xC4)
+
+# ZOBRIST_KEYS[player][bit] for every bit of the 7x7 bitboard layout, sentinel bits included
+ZOBRIST_KEYS = [[0] * 49] + [[_rng.getrandbits(64) for _ in range(49)] for _ in range(2)]
+
+# SIDE_KEYS[original_player][current_player] is mixed into the position hash, since the
+# minimax scores depend on who is to move and on whose point of view they are taken from
+SIDE_KEYS = [[_rng.getrandbits(64) for _ in range(3)] for _ in range(3)]
+
+# mixed into the keys of the negamax searches, whose scores are from the side to move's point of view
+NEGAMAX_KEY = _rng.getrandbits(64)
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# rough size of one stored entry (tuple, 64 bit key and slot in the list) in bytes
+ENTRY_BYTES = 160
+
+# scores at least this large are wins and carry the distance to the win in them
+WIN_THRESHOLD = 1000 - 42
+
+
+def score_to_tt(score, ply: int):
+    """
+    Convert a win or loss score, which counts plies from the root, into one that counts
+    plies from the stored node so the entry stays valid when reached from another root.
+    """
+    if score >= WIN_THRESHOLD:
+        return score + ply
+    if score <= -WIN_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_tt(score, ply: int):
+    """
+    Undo score_to_tt for a node that is ply plies away from the current root.
+    """
+    if score >= WIN_THRESHOLD:
+        return score - ply
+    if score <= -WIN_THRESHOLD:
+        return score + ply
+    return score
+
+
+class TranspositionTable:
+    """
+    A fixed size hash table of search results keyed by Zobrist hash. Every slot holds
+    the full key, the depth that was searched, whether the score is exact or only a
+    lower/upper bound, and the best move found. A slot is overwritten when it is empty,
+    holds the same position, was written by an older search or was searched less deep.
+    """
+    def __init__(self, max_mb: float = 16):
+        """
+        Initialize the table with as many slots as fit in max_mb megabytes, rounded
+        down to a power of two so a slot can be picked with a mask.
+        """
+        entries = max(1, int(max_mb * 1024 * 1024) // ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.slots: List[Optional[Tuple]] = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        return self.size - self.slots.count(None)
+
+    def clear(self):
+        """
+        Remove every entry, used when a new game starts.
+        """
+        self.slots = [None] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """
+        Mark the start of a new search. Entries from earlier searches are still used,
+        but they are the first to be replaced.
+        """
+        self.generation += 1
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, int, Optional[int]]]:
+        """
+        Look up a position. Returns (depth, flag, score, move) or None if it is not stored.
+        """
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1], entry[2], entry[3], entry[4]
+        return None
+
+    def store(self, key: int, depth: int, flag: int, score, move: Optional[int]):
+        """
+        Store the result of searching a position, following the replacement policy.
+        """
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is None or entry[0] == key or entry[5] != self.generation or depth >= entry[1]:
+            self.slots[index] = (key, depth, flag, score, move, self.generation)
+            self.stores += 1
+
+
+# header of a shared table: stop flag and generation, followed by two 64 bit words per slot
+SHARED_HEADER_WORDS = 2
+SHARED_ENTRY_BYTES = 16
+NO_MOVE = 7
+SCORE_OFFSET = 1 << 19
+
+
+class SharedTranspositionTable:
+    """
+    A transposition table that lives in multiprocessing.shared_memory so that several
+    processes can search with it at once. Every slot is two 64 bit words, the key
+    XOR-ed with the packed entry and the packed entry itself. Writers never lock: if two
+    processes write the same slot at the same time, the XOR no longer gives back the
+    key and the torn entry is simply treated as missing. It has the same probe, store
+    and new_search methods as TranspositionTable.
+    """
+    def __init__(self, max_mb: float = 64, name: Optional[str] = None):
+        """
+        Create a new table of at most max_mb megabytes, or attach to the existing table
+        called name (see self.name) from another process.
+        """
+        if name is None:
+            entries = max(1, int(max_mb * 1024 * 1024) // SHARED_ENTRY_BYTES)
+            size = 1 << (entries.bit_length() - 1)
+            self.shm = shared_memory.SharedMemory(create=True, size=(SHARED_HEADER_WORDS + 2 * size) * 8)
+            self.owner = True
+        else:
+            # only meant for worker processes started by the creator, which share its resource tracker
+            self.shm = shared_memory.SharedMemory(name=name)
+            size = (self.shm.size // 8 - SHARED_HEADER_WORDS) // 2
+            size = 1 << (size.bit_length() - 1)
+            self.owner = False
+
+        self.name = self.shm.name
+        self.words = self.shm.buf.cast("Q")
+        self.size = size
+        self.mask = size - 1
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        return sum(1 for index in range(self.size) if self.words[SHARED_HEADER_WORDS + 2 * index + 1])
+
+    @property
+    def generation(self) -> int:
+        return self.words[1]
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        self.shm.buf[:] = bytes(self.shm.size)
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """
+        Mark the start of a new search for every process using the table.
+        """
+        self.words[1] = (self.words[1] + 1) & 0xFF
+        self.words[0] = 0
+
+    def stop(self):
+        """
+        Ask every process searching with the table to stop.
+        """
+        self.words[0] = 1
+
+    def stopped(self) -> bool:
+        """
+        Check if stop has been called since the last new_search.
+        """
+        return self.words[0] != 0
+
+    def probe(self, key: int) -> Optional[Tuple[int, int, int, Optional[int]]]:
+        """
+        Look up a position. Returns (depth, flag, score, move) or None if it is not stored.
+        """
+        index = SHARED_HEADER_WORDS + 2 * (key & self.mask)
+        data = self.words[index + 1]
+        if data == 0 or self.words[index] ^ data != key:
+            return None
+        self.hits += 1
+        move = data & 7
+        return (data >> 5) & 0x3F, (data >> 3) & 3, ((data >> 19) & 0xFFFFF) - SCORE_OFFSET, None if move == NO_MOVE else move
+
+    def store(self, key: int, depth: int, flag: int, score, move: Optional[int]):
+        """
+        Store the result of searching a position, with the same replacement policy as
+        TranspositionTable.
+        """
+        index = SHARED_HEADER_WORDS + 2 * (key & self.mask)
+        generation = self.words[1]
+        old = self.words[index + 1]
+        if old and self.words[index] ^ old != key and (old >> 11) & 0xFF == generation and depth < (old >> 5) & 0x3F:
+            return
+
+        # move (3 bits), flag (2), depth (6), generation (8), score (20) and a set top bit so data is never 0
+        data = (NO_MOVE if move is None else move) | flag << 3 | depth << 5 | generation << 11 | \
+               (int(score) + SCORE_OFFSET) << 19 | 1 << 63
+        self.words[index] = key ^ data
+        self.words[index + 1] = data
+        self.stores += 1
+
+    def close(self):
+        """
+        Detach from the shared memory, and free it if this process created it.
+        """
+        self.words.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,288 @@
+from __future__ import annotations
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple
+from GameServer import GAMES
+import argparse
+import os
+import struct
+import sys
+
+# the game modules are imported by name from their directories, like the bots files do
+for _directory, _, _ in GAMES.values():
+    if _directory not in sys.path:
+        sys.path.insert(0, _directory)
+
+from Connect4 import Connect4
+from TicTacToe import Board
+
+MAGIC = b"GAMEREC1"
+
+CONNECT4, TICTACTOE = 0, 1
+GAME_NAMES = {CONNECT4: "connect4", TICTACTOE: "tictactoe"}
+
+# results, by who won
+UNFINISHED, FIRST_WINS, SECOND_WINS, DRAW = 0, 1, 2, 3
+
+# every record starts with its game, its result, the length of its settings and its number of moves
+HEADER = struct.Struct("<BBBB")
+# bits per move: a Connect 4 column is 0-6, a Tic Tac Toe cell is row * 3 + col, 0-8
+MOVE_BITS = {CONNECT4: 3, TICTACTOE: 4}
+
+
+class GameRecord:
+    """
+    One recorded game: the game (CONNECT4 or TICTACTOE), its moves from the first one
+    on (0-indexed columns, or cells row * 3 + col), the result and a short text with the
+    settings of the engines that played it, for example "pro:depth=7 vs random".
+    """
+    def __init__(self, game: int, moves: Sequence[int], result: int = UNFINISHED, settings: str = ""):
+        if game not in MOVE_BITS:
+            raise ValueError(f"unknown game {game}")
+        if len(moves) > 255 or len(settings.encode()) > 255:
+            raise ValueError("a record holds at most 255 moves and 255 bytes of settings")
+        limit = 7 if game == CONNECT4 else 9
+        if any(not 0 <= move < limit for move in moves):
+            raise ValueError(f"moves of {GAME_NAMES[game]} must be in 0-{limit - 1}")
+        self.game = game
+        self.moves = list(moves)
+        self.result = result
+        self.settings = settings
+
+    def __repr__(self):
+        return f"GameRecord({GAME_NAMES[self.game]}, {self.moves}, result={self.result}, settings={self.settings!r})"
+
+    def __eq__(self, other):
+        return (isinstance(other, GameRecord) and (self.game, self.moves, self.result, self.settings) ==
+                (other.game, other.moves, other.result, other.settings))
+
+    def pack(self) -> bytes:
+        """
+        The record as bytes: the header, the settings and the moves packed into
+        MOVE_BITS bits each, the first move in the lowest bits.
+        """
+        bits = MOVE_BITS[self.game]
+        packed = 0
+        for index, move in enumerate(self.moves):
+            packed |= move << index * bits
+        settings = self.settings.encode()
+        return (HEADER.pack(self.game, self.result, len(settings), len(self.moves)) + settings +
+                packed.to_bytes(packed_size(self.game, len(self.moves)), "little"))
+
+
+def packed_size(game: int, move_count: int) -> int:
+    return (move_count * MOVE_BITS[game] + 7) // 8
+
+
+def unpack_moves(game: int, data: bytes, move_count: int) -> List[int]:
+    bits = MOVE_BITS[game]
+    mask = (1 << bits) - 1
+    packed = int.from_bytes(data, "little")
+    return [packed >> index * bits & mask for index in range(move_count)]
+
+
+def result_of(winner, draw: bool) -> int:
+    """
+    The result of a game from the winner a board's check_win gives (1 or 2, "X" or
+    "O", None) and whether it is drawn.
+    """
+    if winner in (1, "X"):
+        return FIRST_WINS
+    if winner in (2, "O"):
+        return SECOND_WINS
+    return DRAW if draw else UNFINISHED
+
+
+class RecordWriter:
+    """
+    Appends game records to a file one at a time, so games can be logged as they are
+    played. Use it as a context manager, or call close when done.
+    """
+    def __init__(self, path: str, flush_every: int = 1):
+        """
+        Open the record file at path, starting it if it does not exist yet. The file
+        is flushed after every flush_every records.
+        """
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) >= len(MAGIC):
+            with open(path, "rb") as file:
+                if file.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{path} is not a game record file")
+            # a record left half written by an interrupted writer is dropped before appending
+            os.truncate(path, _complete_size(path))
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            self.file.write(MAGIC)
+        self.flush_every = flush_every
+        self.unflushed = 0
+
+    def __enter__(self) -> RecordWriter:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, record: GameRecord):
+        self.file.write(record.pack())
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.file.flush()
+            self.unflushed = 0
+
+    def close(self):
+        self.file.close()
+
+
+def _read_record(file: BinaryIO) -> Optional[GameRecord]:
+    """
+    Read the next record of a file, or None at its end or at a record cut short.
+    """
+    header = file.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    game, result, settings_size, move_count = HEADER.unpack(header)
+    settings = file.read(settings_size)
+    data = file.read(packed_size(game, move_count))
+    if len(settings) < settings_size or len(data) < packed_size(game, move_count):
+        return None
+    return GameRecord(game, unpack_moves(game, data, move_count), result, settings.decode())
+
+
+def _complete_size(path: str) -> int:
+    """
+    The size of the records of a file up to the end of its last complete one.
+    """
+    end = len(MAGIC)
+    with open(path, "rb") as file:
+        file.seek(end)
+        while _read_record(file) is not None:
+            end = file.tell()
+    return end
+
+
+def read_records(path: str, game: Optional[int] = None) -> Iterator[GameRecord]:
+    """
+    Read the records of a file one at a time, only those of game if it is given. The
+    file is read as the records are asked for, so files of any size can be gone
+    through. A record cut short at the end of the file is skipped.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a game record file")
+        while True:
+            record = _read_record(file)
+            if record is None:
+                return
+            if game is None or record.game == game:
+                yield record
+
+
+def replay(record: GameRecord) -> Iterator[Tuple[int, object]]:
+    """
+    Play the moves of a record on a new board with Connect4.drop_disc or
+    Board.make_move, yielding the move and the board after each one. The same board
+    object is yielded every time, so copy it to keep a position. Raises ValueError on
+    a move that is illegal or comes after the game ended.
+    """
+    board = Connect4() if record.game == CONNECT4 else Board()
+    players = (1, 2) if record.game == CONNECT4 else ("X", "O")
+    for index, move in enumerate(record.moves):
+        if board.check_win() is not None:
+            raise ValueError(f"move {index + 1} comes after the game was won")
+        player = players[index % 2]
+        if record.game == CONNECT4:
+            legal = board.drop_disc(move + 1, player)
+        else:
+            legal = board.make_move(move // 3 + 1, move % 3 + 1, player)
+        if not legal:
+            raise ValueError(f"move {index + 1} ({move}) is illegal")
+        yield move, board
+
+
+def record_from_history(game: int, board, settings: str = "") -> GameRecord:
+    """
+    Record the game on a Connect4 or Board from the moves in its history.
+    """
+    if game == CONNECT4:
+        moves = [col for _, col, _ in board.history]
+    else:
+        moves = [row * 3 + col for row, col, _ in board.history]
+    return GameRecord(game, moves, result_of(board.check_win(), board.check_draw()), settings)
+
+
+def import_into_book(path: str, max_ply: int, depth: int = 9, time_budget: Optional[float] = None,
+                     workers: Optional[int] = None, output: Optional[str] = None) -> int:
+    """
+    Add the Connect 4 positions of the first max_ply moves of every game in a record
+    file to the opening book, solving the ones that are not in it yet with BookBuilder.
+    Returns the number of positions in the book.
+    """
+    import BookBuilder
+    from OpeningBook import OpeningBook
+    output = output or BookBuilder.BOOK_PATH
+    games = (record.moves for record in read_records(path, CONNECT4))
+    book = OpeningBook.load(output)
+    positions = [board for board in BookBuilder.positions_from_games(games, max_ply) if book.get_move(board) is None]
+    return BookBuilder.build_book(max_ply, depth, time_budget, workers, output, positions=positions)
+
+
+def import_into_tablebase(path: str, cells: int = 12, workers: Optional[int] = None,
+                          output: Optional[str] = None) -> int:
+    """
+    Add the Connect 4 position with cells empty cells of every game in a record file
+    that got that far to the endgame tablebase, solving the ones that are not in it yet
+    with TableBase.build_tablebase. Records with an illegal move before that position
+    are skipped. Returns the number of positions in the tablebase.
+    """
+    import TableBase
+    from Bitboard import Bitboard
+    output = output or TableBase.TABLEBASE_PATH
+    tablebase = TableBase.TableBase.load(output)
+    positions = []
+    for record in read_records(path, CONNECT4):
+        if len(record.moves) <= 42 - cells:
+            continue
+        try:
+            for ply, (_, board) in enumerate(replay(record), 1):
+                if ply == 42 - cells:
+                    break
+        except ValueError:
+            # an illegal move before the position, the record is skipped
+            continue
+        position = Bitboard(board.board)
+        player = 1 if ply % 2 == 0 else 2
+        if tablebase.probe(position.boards[player], position.boards[1] | position.boards[2]) is None:
+            positions.append(position)
+    return TableBase.build_tablebase(cells, 0, workers=workers, output=output, positions=positions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Look at game record files or add their games to the opening book "
+                                                 "or the endgame tablebase.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    show = commands.add_parser("show", help="print the games of a file")
+    show.add_argument("path")
+    book = commands.add_parser("import", help="add the Connect 4 positions of a file to the opening book")
+    book.add_argument("path")
+    book.add_argument("--ply", type=int, default=8, help="deepest position to take from every game")
+    book.add_argument("--depth", type=int, default=9, help="search depth for every new position")
+    book.add_argument("--time", type=float, default=None, help="search every position for this many seconds instead")
+    book.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    book.add_argument("--output", default=None, help="book file to write")
+    endgames = commands.add_parser("endgames", help="add the Connect 4 endgames of a file to the tablebase")
+    endgames.add_argument("path")
+    endgames.add_argument("--cells", type=int, default=12, help="empty cells of the position to take from every game")
+    endgames.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    endgames.add_argument("--output", default=None, help="tablebase file to write")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        results = {UNFINISHED: "unfinished", FIRST_WINS: "first player wins", SECOND_WINS: "second player wins", DRAW: "draw"}
+        for record in read_records(args.path):
+            print(f"{GAME_NAMES[record.game]:9} {results[record.result]:18} {' '.join(map(str, record.moves))}"
+                  f"{'  (' + record.settings + ')' if record.settings else ''}")
+    elif args.command == "endgames":
+        count = import_into_tablebase(args.path, args.cells, args.workers, args.output)
+        print(f"The tablebase now holds {count} positions")
+    else:
+        count = import_into_book(args.path, args.ply, args.depth, args.time, args.workers, args.output)
+        print(f"The book now holds {count} positions")
@@ -0,0 +1,364 @@
+from __future__ import annotations
+from typing import Dict, Optional, Set
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import secrets
+import signal
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# for every game: its directory, the file with its bots and the bot that plays on the server
+GAMES = {
+    "connect4": (os.path.join(ROOT, "Connect 4"), "Connect4 Bots.py", "PlayPro"),
+    "tictactoe": (os.path.join(ROOT, "TicTacToe"), "TicTacToe Bots.py", "PlayProBot"),
+}
+
+# the modules of the bots of every game, imported on first use in each process
+_modules = {}
+# the engine of every game in a worker process, created on its first search
+_engines = {}
+
+
+def load_bots(game: str):
+    """
+    Import the bots file of a game, which can not be imported by name because of the
+    space in it, with the game's directory on the path for the modules it imports.
+    """
+    if game not in _modules:
+        directory, filename, _ = GAMES[game]
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+        spec = importlib.util.spec_from_file_location(filename[:-3].replace(" ", ""), os.path.join(directory, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[game] = module
+    return _modules[game]
+
+
+def _engine(game: str):
+    """
+    Return the engine of a game in this worker process. It is kept between searches,
+    so its tables and opening book stay loaded.
+    """
+    if game not in _engines:
+        _engines[game] = getattr(load_bots(game), GAMES[game][2])()
+    return _engines[game]
+
+
+def _load_engines():
+    for game in GAMES:
+        _engine(game)
+
+
+def _best_move(game: str, position: list, time_budget: Optional[float]):
+    """
+    Search a position in a worker process with the game's engine and return its move.
+    """
+    engine = _engine(game)
+    engine.new_game(position)
+    return engine.best_move(time_budget)
+
+
+class Session:
+    """
+    One game on the server. It only holds the board, through the headless methods of
+    the game's base class, while the engine that finds the bot's moves runs in the
+    process pool.
+    """
+    def __init__(self, game: str, bot_player):
+        bots = load_bots(game)
+        self.game = game
+        self.play = bots.PlayConnect4() if game == "connect4" else bots.PlayTicacToe()
+        self.bot_player = bot_player
+        # requests for the same game are handled one at a time
+        self.lock = asyncio.Lock()
+
+    def apply(self, move) -> bool:
+        """
+        Play a move as it came in a request: a column for Connect 4, [row, col] for Tic
+        Tac Toe, both 0-indexed.
+        """
+        if self.game == "connect4":
+            return type(move) is int and self.play.apply_move(move)
+        return (isinstance(move, list) and len(move) == 2 and all(type(value) is int for value in move)
+                and self.play.apply_move(*move))
+
+    def state(self) -> dict:
+        winner = self.play.board.check_win()
+        return {
+            "board": self.play.board.board,
+            "to_move": self.play.to_move(),
+            "bot": self.bot_player,
+            "winner": winner,
+            "draw": self.play.board.check_draw(),
+        }
+
+
+class GameServer:
+    """
+    Serves games against the bots to many clients at once over TCP. Every message is
+    one line of JSON. A request has an "op" and an optional "tag" that is sent back in
+    the response, so a client can have several requests on the way and match the
+    responses, which come back in the order they finish. The ops are:
+
+    new    {"game": "connect4" or "tictactoe", "bot_first": bool}, starts a game and
+           returns its "id", letting the bot move first if asked
+    move   {"id", "move", "time_budget"}, plays the client's move and the bot's reply
+    hint   {"id", "time_budget"}, the bot's move for the side to move, not played
+    state  {"id"}, the board, whose turn it is and the result so far
+    close  {"id"}, ends a game
+
+    Every response has "ok", with an "error" if it is false, and the game's "state".
+    Searches run in a process pool, so the event loop only ever parses requests and
+    updates boards and keeps serving while the bots think. The games a connection
+    started are closed when it disconnects.
+    """
+    def __init__(self, workers: Optional[int] = None, time_budget: float = 1.0, max_time_budget: float = 10.0,
+                 records: Optional[str] = None):
+        """
+        Start the process pool, by default with one worker per CPU. Bots think for
+        time_budget seconds a move unless a request asks for a different time, which
+        can be at most max_time_budget. If records is given, every game that is played
+        to the end is appended to that game record file (see GameRecords.py).
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.time_budget = time_budget
+        self.max_time_budget = max_time_budget
+        self.sessions: Dict[str, Session] = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.recorder = None
+        if records is not None:
+            # GameRecords imports this module for the game directories
+            from GameRecords import RecordWriter
+            self.recorder = RecordWriter(records)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        """
+        Start listening, on a free port if port is 0. Returns the asyncio server, whose
+        sockets tell the port that was picked.
+        """
+        # start the workers before there are any client sockets: forked workers would
+        # inherit them and keep them open after the server closes its end
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, _load_engines) for _ in range(self.workers)])
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        return self.server
+
+    async def serve_forever(self, host: str = "127.0.0.1", port: int = 8765):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        """
+        Stop listening and shut the process pool down.
+        """
+        if self.server is not None:
+            self.server.close()
+        self.executor.shutdown(cancel_futures=True)
+        if self.recorder is not None:
+            self.recorder.close()
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        owned: Set[str] = set()
+        tasks = set()
+
+        async def respond(line: bytes):
+            request = {}
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    request = {}
+                    raise ValueError("a request must be a JSON object")
+                response = await self.handle(request, owned)
+            except Exception as error:
+                # a bad request or a failed search only fails this one request
+                response = {"ok": False, "error": str(error) or type(error).__name__}
+            if "tag" in request:
+                response["tag"] = request["tag"]
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (ConnectionError, asyncio.LimitOverrunError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for game_id in owned:
+                self.sessions.pop(game_id, None)
+            writer.close()
+
+    async def handle(self, request: dict, owned: Set[str]) -> dict:
+        """
+        Carry out one request and return the response.
+        """
+        op = request.get("op")
+        if op == "new":
+            game = request.get("game")
+            if game not in GAMES:
+                return {"ok": False, "error": f"unknown game {game!r}"}
+            bot_first = bool(request.get("bot_first", False))
+            time_budget = self.time_budget_of(request)
+            bot_player = (1 if bot_first else 2) if game == "connect4" else ("X" if bot_first else "O")
+            game_id = secrets.token_hex(8)
+            session = Session(game, bot_player)
+            self.sessions[game_id] = session
+            owned.add(game_id)
+            response = {"ok": True, "id": game_id}
+            if bot_first:
+                async with session.lock:
+                    response["bot_move"] = await self.bot_move(session, time_budget)
+            response["state"] = session.state()
+            return response
+
+        if op not in ("move", "hint", "state", "close"):
+            return {"ok": False, "error": f"unknown op {op!r}"}
+        session = self.sessions.get(request.get("id"))
+        if session is None:
+            return {"ok": False, "error": "unknown game id"}
+
+        async with session.lock:
+            if op == "move":
+                time_budget = self.time_budget_of(request)
+                if session.play.to_move() == session.bot_player or not session.apply(request.get("move")):
+                    return {"ok": False, "error": "illegal move", "state": session.state()}
+                response = {"ok": True}
+                if not session.play.game_over():
+                    try:
+                        response["bot_move"] = await self.bot_move(session, time_budget)
+                    except Exception:
+                        # take the move back so the client can try again
+                        session.play.board.undo_move()
+                        raise
+                if session.play.game_over():
+                    self.record(session)
+            elif op == "hint":
+                if session.play.game_over():
+                    return {"ok": False, "error": "the game is over", "state": session.state()}
+                response = {"ok": True, "move": await self.search(session, self.time_budget_of(request))}
+            elif op == "state":
+                response = {"ok": True}
+            else:
+                self.sessions.pop(request["id"], None)
+                owned.discard(request["id"])
+                return {"ok": True}
+            response["state"] = session.state()
+            return response
+
+    def record(self, session: Session):
+        """
+        Log a finished game, if the server keeps records.
+        """
+        if self.recorder is not None:
+            from GameRecords import CONNECT4, TICTACTOE, record_from_history
+            game = CONNECT4 if session.game == "connect4" else TICTACTOE
+            settings = f"{GAMES[session.game][2]} as {session.bot_player}"
+            self.recorder.write(record_from_history(game, session.play.board, settings))
+
+    def time_budget_of(self, request: dict) -> float:
+        """
+        Return the seconds the bot may think as asked for in a request, at most
+        max_time_budget, or the server's time budget if the request does not say.
+        """
+        time_budget = request.get("time_budget", self.time_budget)
+        if isinstance(time_budget, bool) or not isinstance(time_budget, (int, float)) or time_budget <= 0:
+            raise ValueError("time_budget must be a positive number of seconds")
+        return min(float(time_budget), self.max_time_budget)
+
+    async def search(self, session: Session, time_budget: float):
+        """
+        Find the bot's move for the side to move of a game in the process pool.
+        """
+        position = [row.copy() for row in session.play.board.board]
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _best_move, session.game, position, time_budget)
+
+    async def bot_move(self, session: Session, time_budget: float):
+        """
+        Search the bot's move and play it.
+        """
+        move = await self.search(session, time_budget)
+        session.apply(list(move) if isinstance(move, tuple) else move)
+        return move
+
+
+class GameClient:
+    """
+    A client for GameServer that can have many requests on the way at once over one
+    connection.
+    """
+    def __init__(self):
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.tags = itertools.count()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.listener: Optional[asyncio.Task] = None
+
+    async def connect(self, host: str = "127.0.0.1", port: int = 8765) -> GameClient:
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.listener = asyncio.ensure_future(self.listen())
+        return self
+
+    async def listen(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.pending.pop(response.pop("tag", None), None)
+            if future is not None and not future.done():
+                future.set_result(response)
+        for future in self.pending.values():
+            future.set_exception(ConnectionError("the server closed the connection"))
+
+    async def request(self, op: str, **fields) -> dict:
+        """
+        Send a request and wait for its response.
+        """
+        tag = next(self.tags)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[tag] = future
+        self.writer.write(json.dumps({"op": op, "tag": tag, **fields}).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        if self.listener is not None:
+            self.listener.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Connect 4 and Tic Tac Toe games against the bots.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="number of search processes")
+    parser.add_argument("--time", type=float, default=1.0, help="seconds the bots think per move")
+    parser.add_argument("--records", default=None, help="game record file to log finished games to")
+    args = parser.parse_args()
+
+    server = GameServer(args.workers, args.time, records=args.records)
+    # stop like on Ctrl+C when terminated, so the worker processes are shut down too
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
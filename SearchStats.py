@@ -0,0 +1,144 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Tuple
+import cProfile
+import functools
+import io
+import pstats
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget for the move has run out. The
+    board being searched is left mid-line and has to be thrown away."""
+
+
+class SearchStats:
+    """
+    What one search call of a bot did: the nodes it visited, the leaves it evaluated,
+    its beta cutoffs by ply, whether the move was found while pondering, and the nodes
+    and time of every iteration. The bots of each game subclass it with what only their
+    search does, like the probes of its table of positions.
+    It is only filled in when the bot's collect_stats is set. The search then gets
+    counting versions of its evaluation and other functions, so a search without
+    statistics runs exactly the code it always did.
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.evaluations = 0
+        # the move was found while pondering on the opponent's time
+        self.ponder_hit = False
+        # cutoffs[ply] is the number of beta cutoffs that many moves below the root
+        self.cutoffs: List[int] = []
+        # (depth, nodes, seconds) of every iteration that finished
+        self.iterations: List[Tuple[int, int, float]] = []
+        self.seconds = 0.0
+
+    def counting_evaluate(self, evaluate: Callable) -> Callable:
+        def counted(player) -> int:
+            self.evaluations += 1
+            return evaluate(player)
+        return counted
+
+    def add_cutoff(self, ply: int):
+        while len(self.cutoffs) <= ply:
+            self.cutoffs.append(0)
+        self.cutoffs[ply] += 1
+
+    def add_iteration(self, depth: int, nodes: int, seconds: float):
+        """
+        Record an iteration to depth that finished after the search had visited nodes
+        nodes in seconds, both counted from the start of the search.
+        """
+        self.iterations.append((depth, nodes - self.nodes, seconds - self.seconds))
+        self.nodes, self.seconds = nodes, seconds
+
+    @property
+    def depth(self) -> int:
+        return self.iterations[-1][0] if self.iterations else 0
+
+    @property
+    def branching_factor(self) -> float:
+        """
+        The effective branching factor: the b for which a tree of depth d with b
+        children per node has as many nodes as the deepest iteration visited.
+        """
+        if not self.iterations or self.iterations[-1][0] == 0:
+            return 0.0
+        depth, nodes, _ = self.iterations[-1]
+        return nodes ** (1 / depth)
+
+    def iteration_growth(self) -> List[float]:
+        """
+        How many times more nodes every iteration visited than the one before it.
+        """
+        return [nodes / previous[1] if previous[1] else 0.0
+                for previous, (_, nodes, _) in zip(self.iterations, self.iterations[1:])]
+
+    @property
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "nodes": self.nodes,
+            "evaluations": self.evaluations,
+            "ponder_hit": self.ponder_hit,
+            "cutoffs": self.cutoffs,
+            "iterations": self.iterations,
+            "seconds": self.seconds,
+            "depth": self.depth,
+            "branching_factor": self.branching_factor,
+            "iteration_growth": self.iteration_growth(),
+            "nodes_per_second": self.nodes_per_second,
+        }
+
+    def describe_probes(self) -> str:
+        """
+        How the lookups of the search's table of positions went, for the summary.
+        """
+        return "no table probes"
+
+    def describe_cutoffs(self, ply: int) -> str:
+        """
+        Anything more to say about the cutoffs at ply, for the summary.
+        """
+        return ""
+
+    def __str__(self):
+        if self.ponder_hit:
+            return "pondered move"
+        lines = [f"{self.nodes} nodes in {self.seconds:.3f}s ({self.nodes_per_second:.0f}/s), depth {self.depth}, "
+                 f"branching factor {self.branching_factor:.2f}",
+                 f"{self.evaluations} leaf evaluations, {self.describe_probes()}"]
+        for depth, nodes, seconds in self.iterations:
+            lines.append(f"  depth {depth:2}: {nodes:9} nodes {seconds:8.3f}s")
+        for ply, count in enumerate(self.cutoffs):
+            if count:
+                lines.append(f"  ply {ply:2}: {count:7} cutoffs{self.describe_cutoffs(ply)}")
+        return "\n".join(lines)
+
+
+def profiled(method):
+    """
+    Run a search method under the bot's profiler, if it has one, so the time of every
+    function it calls is added to the profile.
+    """
+    @functools.wraps(method)
+    def run(self, *args, **kwargs):
+        if self.profiler is None:
+            return method(self, *args, **kwargs)
+        self.profiler.enable()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.profiler.disable()
+    return run
+
+
+def profile_report(profiler: cProfile.Profile, top: int = 20, sort: str = "tottime") -> str:
+    """
+    Describe the top functions of a profile, by the time spent in them by default.
+    """
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats(sort).print_stats(top)
+    return output.getvalue()
@@ -0,0 +1,129 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple
+import os
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tictactoe_table.bin")
+
+CELL_VALUES = {".": 0, "X": 1, "O": 2}
+POWERS = [3 ** index for index in range(9)]
+LINES = [(0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)]
+
+# entries of the table: the best move in the low 4 bits and the value for the side to move + 1 above them
+NO_MOVE = 0x0F
+
+
+# the table of this process, loaded or built on first use
+_table: Optional[bytes] = None
+
+
+def encode(cells: List[int]) -> int:
+    """
+    Encode the 9 cells (0 empty, 1 X, 2 O, row by row) as a base 3 number.
+    """
+    return sum(cell * power for cell, power in zip(cells, POWERS))
+
+
+def _wins(cells: List[int], index: int) -> bool:
+    player = cells[index]
+    return any(index in line and cells[line[0]] == cells[line[1]] == cells[line[2]] == player for line in LINES)
+
+
+def build_table() -> bytes:
+    """
+    Solve every position that can come up in a game where X moves first. The value of a
+    position prefers quick wins and slow losses, and ties go to the first cell. Every
+    reachable position is stored at its own code, so a lookup is a single index.
+    """
+    results = {}
+
+    def negamax(cells: List[int], moves_played: int) -> int:
+        code = encode(cells)
+        if code in results:
+            return results[code][0]
+
+        player = 1 if moves_played % 2 == 0 else 2
+        best_score, best_move = None, NO_MOVE
+        for index in range(9):
+            if cells[index] == 0:
+                cells[index] = player
+                if _wins(cells, index):
+                    score = 10 - (moves_played + 1)
+                elif moves_played + 1 == 9:
+                    score = 0
+                else:
+                    score = -negamax(cells, moves_played + 1)
+                cells[index] = 0
+                if best_score is None or score > best_score:
+                    best_score, best_move = score, index
+
+        results[code] = (best_score, best_move)
+        return best_score
+
+    negamax([0] * 9, 0)
+
+    table = bytearray([NO_MOVE] * 3 ** 9)
+    for code, (score, move) in results.items():
+        sign = (score > 0) - (score < 0)
+        table[code] = move | (sign + 1) << 4
+    return bytes(table)
+
+
+def save_table(path: str = TABLE_PATH):
+    """
+    Build the table and write it to path.
+    """
+    with open(path, "wb") as file:
+        file.write(build_table())
+
+
+def load_table(path: str = TABLE_PATH) -> bytes:
+    """
+    Return the table, reading it from path the first time or building it if the file
+    does not exist.
+    """
+    global _table
+    if _table is None:
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                _table = file.read()
+        else:
+            _table = build_table()
+    return _table
+
+
+def side_to_move(board: List[List[str]]) -> str:
+    """
+    Return the player to move, assuming X moved first.
+    """
+    cells = [cell for row in board for cell in row]
+    return "X" if cells.count("X") == cells.count("O") else "O"
+
+
+def lookup(board: List[List[str]]) -> Tuple[Optional[Tuple[int, int]], int]:
+    """
+    Look up a Board.board position. Returns the best (0-indexed) (row, col) for the
+    player to move, or None if the game is over, and the value of the position for that
+    player: 1 for a win, 0 for a draw and -1 for a loss.
+    """
+    code = 0
+    for row in reversed(board):
+        for cell in reversed(row):
+            code = code * 3 + CELL_VALUES[cell]
+    entry = load_table()[code]
+    move = entry & 0x0F
+    if move == NO_MOVE:
+        return None, 0
+    return (move // 3, move % 3), (entry >> 4) - 1
+
+
+def best_move(board: List[List[str]]) -> Optional[Tuple[int, int]]:
+    """
+    Return the best (0-indexed) (row, col) for the player to move in a Board.board
+    position, or None if the game is over.
+    """
+    return lookup(board)[0]
+
+
+if __name__ == "__main__":
+    save_table()
+    print(f"Wrote {TABLE_PATH}")
@@ -1,7 +1,63 @@
 from __future__ import annotations
-from typing import List, Optional
-from TicTacToe import Board
+from typing import Callable, Dict, List, Optional, Tuple
+from TicTacToe import Board, MNKBoard
+import PerfectPlay
+import cProfile
+import os
 import random
+import sys
+import threading
+import time
+
+# modules shared by both games live in the directory above
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+
+from SearchStats import SearchStats, SearchTimeout, profiled
+
+# scores of won positions, above anything the evaluation can give; a win with more empty cells left scores higher
+WIN_SCORE = 10 ** 9
+# hashed into the key of positions where O is to move
+SIDE_KEY = random.Random(0x7A7).getrandbits(64)
+
+# kinds of scores in the memo
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TicTacToeSearchStats(SearchStats):
+    """
+    SearchStats of the Tic Tac Toe bots, which also counts their memo probes and hits
+    and whether the move came from the solved table.
+    """
+    def __init__(self):
+        SearchStats.__init__(self)
+        self.memo_probes = 0
+        self.memo_hits = 0
+        self.table_hit = False
+
+    def counting_probe(self, probe: Callable[[int], Optional[tuple]]) -> Callable[[int], Optional[tuple]]:
+        def counted(key: int) -> Optional[tuple]:
+            self.memo_probes += 1
+            entry = probe(key)
+            if entry is not None:
+                self.memo_hits += 1
+            return entry
+        return counted
+
+    def as_dict(self) -> Dict[str, object]:
+        stats = SearchStats.as_dict(self)
+        stats.update(memo_probes=self.memo_probes, memo_hits=self.memo_hits, table_hit=self.table_hit)
+        return stats
+
+    def describe_probes(self) -> str:
+        return f"{self.memo_hits} of {self.memo_probes} memo probes hit"
+
+    def __str__(self):
+        if self.table_hit:
+            return "solved table move"
+        return SearchStats.__str__(self)
+
 
 class PlayTicacToe:
     """
@@ -17,6 +73,42 @@ class PlayTicacToe:
         """
         raise NotImplementedError
 
+    def new_game(self, position: Optional[List[List[str]]] = None):
+        """
+        Start a new game without any input or output, on an empty board or from a
+        Board.board position. X moves first.
+        """
+        self.board = Board(position)
+
+    def game_over(self) -> bool:
+        """
+        Check if the game has been won or drawn.
+        """
+        return self.board.check_win() is not None or self.board.check_draw()
+
+    def to_move(self) -> str:
+        """
+        Return the player whose turn it is.
+        """
+        return "X" if self.board.moves_played % 2 == 0 else "O"
+
+    def apply_move(self, row: int, col: int) -> bool:
+        """
+        Make a move for the player to move at the (0-indexed) row and column. Returns
+        False and leaves the game as it was if the cell is taken or does not exist, or
+        if the game is already over.
+        """
+        if self.game_over():
+            return False
+        return self.board.make_move(row + 1, col + 1, self.to_move())
+
+    def best_move(self, time_budget: Optional[float] = None) -> tuple[int, int]:
+        """
+        Return the (0-indexed) (row, col) the bot would play for the player to move,
+        without playing it. This method should be overridden in subclasses.
+        """
+        raise NotImplementedError
+
 class PlayDumbassBot(PlayTicacToe):
     """
     A class representing a Tic Tac Toe game with a dumb bot."""
@@ -70,6 +162,11 @@ class PlayProBot(PlayTicacToe):
     """
     def __init__(self):
         PlayTicacToe.__init__(self)
+        # when collect_stats is set, every minimax call leaves a SearchStats in self.stats
+        self.collect_stats = False
+        self.stats: Optional[TicTacToeSearchStats] = None
+        # a cProfile.Profile to run every minimax call under, see profile_report in SearchStats.py
+        self.profiler: Optional[cProfile.Profile] = None
 
     def start(self):
         """
@@ -103,47 +200,371 @@ class PlayProBot(PlayTicacToe):
         else:
             print("The following game ended in a draw!")
 
+    def best_move(self, time_budget: Optional[float] = None) -> tuple[int, int]:
+        """
+        Find the best (0-indexed) (row, col) for the player to move without playing it.
+        The answer comes from the solved table, so there is no need for a time_budget.
+        """
+        if self.game_over():
+            raise ValueError("the game is over")
+        return self.minimax(self.board.board, 9, self.to_move())
+
+    @profiled
     def minimax(self, position: List[List[str]], depth: int, max_player: str) -> tuple[int, int]:
         """
-        Minimax algorithm to find the best move for the bot.
-        The bot is the minimizing player and the player is the maximizing player.
-        The function returns the best move for the bot. 
-        """
-        # so the minimizing player is O (the bot) and the maximizing player is X (the player)
-        def helper(position: List[List[str]], depth: int, max_player: str):
-            temp_board = Board(position)
-            evaluation = temp_board.check_win()
-
-            # base cases 
-            if evaluation == "X":
-                return -1, None
-            if evaluation == "O":
-                return 1, None
-            if temp_board.check_draw():
+        Find the best move for max_player. Every position of the game has been solved
+        ahead of time (see PerfectPlay.py), so this is a single table lookup. Positions
+        where max_player is not the one to move are searched with search instead.
+        """
+        self.stats = TicTacToeSearchStats() if self.collect_stats else None
+        if PerfectPlay.side_to_move(position) == max_player:
+            move = PerfectPlay.best_move(position)
+            if move is not None:
+                if self.stats is not None:
+                    self.stats.table_hit = True
+                return move
+        return self.search(position, depth, max_player)
+
+    def search(self, position: List[List[str]], depth: int, max_player: str) -> tuple[int, int]:
+        """
+        Find the best move for max_player with the alpha-beta search of PlayMNKBot on a
+        3x3 board, which searches every line to the end when depth is 9.
+        """
+        bot = PlayMNKBot(3, 3, 3, depth, None)
+        bot.collect_stats = self.collect_stats
+        move = bot.minimax(position, depth, max_player)
+        self.stats = bot.stats
+        return move
+
+
+class PlayMNKBot(PlayTicacToe):
+    """
+    A class representing a game of Tic Tac Toe on a bigger board, rows x cols where k in
+    a row wins, against a bot. Boards like 4x4 or 5x5 have far too many positions to
+    search to the end, so the bot searches with alpha-beta pruning up to a depth,
+    deepening one move at a time until its time budget runs out, and scores the
+    positions at the depth by how many marks each player has on the lines still open
+    to them. Positions it has searched are remembered by their hash, so the many
+    move orders that lead to the same position are only searched once.
+    """
+    def __init__(self, rows: int = 4, cols: int = 4, k: int = 4, depth: int = 16, time_budget: Optional[float] = 1.0,
+                 max_memo: int = 1000000):
+        """
+        Initialize the game with a rows x cols board. The bot searches at most depth moves
+        ahead and for at most time_budget seconds a move (no limit if None), and forgets the
+        positions it remembers once it has more than max_memo of them.
+        """
+        PlayTicacToe.__init__(self)
+        self.board = MNKBoard(rows, cols, k)
+        self.depth = depth
+        self.time_budget = time_budget
+        self.max_memo = max_memo
+        # position key -> (depth, kind of score, score, best move)
+        self.memo = {}
+        # statistics of the last search: nodes searched, depth reached and score for the bot
+        self.nodes = 0
+        self.reached = 0
+        self.score = None
+        # when collect_stats is set, every minimax call leaves a SearchStats in self.stats
+        self.collect_stats = False
+        self.stats: Optional[TicTacToeSearchStats] = None
+        # a cProfile.Profile to run every minimax call under, see profile_report in SearchStats.py
+        self.profiler: Optional[cProfile.Profile] = None
+        # checked together with the deadline, a search stops early once it returns True
+        self.should_stop: Optional[Callable[[], bool]] = None
+        # start searches the replies to every move of the opponent while it waits for them
+        self.ponder = True
+        self.ponder_thread: Optional[threading.Thread] = None
+        self.ponder_stop = threading.Event()
+        # opponent (row, col) -> (depth, reply, score) of the deepest search of that move finished while pondering
+        self.ponder_replies: Dict[tuple[int, int], Tuple[int, tuple[int, int], Optional[int]]] = {}
+        # the depth a pondered reply needs to be played without searching again
+        self.ponder_depth = depth
+
+    def start(self):
+        """
+        Start the game with the bot. You play X and move first.
+        """
+        print(f"Let the games begin! You will be playing as X and the bot will be playing as O. "
+              f"Get {self.board.k} in a row to win. \n")
+        print(self.board.display())
+
+        while self.board.check_win() is None and not self.board.check_draw():
+            if self.ponder:
+                self.start_pondering("O")
+            try:
+                move = input("Input your move in (x,y): ").split(",")
+
+                while len(move) != 2 or not self.board.make_move(move[1], move[0], "X"):
+                    move = input("Invalid move, input your move in (x,y): ").split(",")
+            finally:
+                self.stop_pondering()
+
+            print(f"You made the move ({move[1]}, {move[0]}). The current position of the board is: \n \n" + self.board.display() + "\n \n")
+
+            if self.board.check_win() or self.board.check_draw():
+                break
+
+            bot_move = self.pondered_reply(self.board.last_move)
+            if bot_move is None:
+                bot_move = self.minimax(self.board.board, self.depth, "O")
+
+            self.board.make_move(bot_move[0]+1, bot_move[1]+1, "O")
+
+            print(f"The bot the move ({bot_move[1]+1}, {bot_move[0]+1}). The current position of the board is: \n \n" + self.board.display() + "\n \n")
+
+        winner = self.board.check_win()
+
+        if winner is not None:
+            print("The winner is " + winner + "!")
+        else:
+            print("The following game ended in a draw!")
+
+    def new_game(self, position: Optional[List[List[str]]] = None):
+        """
+        Start a new game on an empty board of the same size, or from a position of it.
+        The positions the bot remembers are kept, they are just as good in a new game.
+        """
+        self.board = MNKBoard(self.board.rows, self.board.cols, self.board.k, position)
+
+    def best_move(self, time_budget: Optional[float] = None) -> tuple[int, int]:
+        """
+        Find the best (0-indexed) (row, col) for the player to move without playing it,
+        searching for time_budget seconds, or self.time_budget if that is not given.
+        """
+        if self.game_over():
+            raise ValueError("the game is over")
+        if time_budget is None:
+            return self.minimax(self.board.board, self.depth, self.to_move())
+
+        default_budget = self.time_budget
+        self.time_budget = time_budget
+        try:
+            return self.minimax(self.board.board, self.depth, self.to_move())
+        finally:
+            self.time_budget = default_budget
+
+    def start_pondering(self, player: str):
+        """
+        Start searching, in a background thread, the best reply of player to every move
+        the opponent can make in the position on self.board, one move deeper at a time
+        for all of them and without a time limit, with the opponent's likeliest moves
+        first. The searches fill self.memo, so even a reply that was not pondered deep
+        enough is found quicker afterwards. Call stop_pondering before searching again.
+        """
+        self.stop_pondering()
+        # a pondered reply is used if it is as deep as the search that would replace it
+        self.ponder_depth = self.depth if self.time_budget is None else (self.reached or self.depth)
+        self.ponder_replies = {}
+        self.ponder_stop = threading.Event()
+        position = [row.copy() for row in self.board.board]
+        self.ponder_thread = threading.Thread(target=self.ponder_replies_of, daemon=True,
+                                              args=(position, player, self.ponder_stop, self.ponder_replies))
+        self.ponder_thread.start()
+
+    def stop_pondering(self) -> Dict[tuple[int, int], Tuple[int, tuple[int, int], Optional[int]]]:
+        """
+        Stop the pondering thread and wait for it. Returns the replies it found.
+        """
+        if self.ponder_thread is not None:
+            self.ponder_stop.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+        return self.ponder_replies
+
+    def ponder_replies_of(self, position: List[List[str]], player: str, stop: threading.Event,
+                          replies: Dict[tuple[int, int], Tuple[int, tuple[int, int], Optional[int]]]):
+        """
+        The pondering thread: search the replies to every move of the opponent with
+        minimax until stop is set, storing the deepest result of each in replies.
+        """
+        opponent = "X" if player == "O" else "O"
+        board = MNKBoard(self.board.rows, self.board.cols, self.board.k, position)
+        cells = board.get_available_moves()
+        default_budget, default_should_stop = self.time_budget, self.should_stop
+        self.time_budget, self.should_stop = None, stop.is_set
+        try:
+            for depth in range(1, len(cells)):
+                for row, col in cells:
+                    reply = replies.get((row, col))
+                    if reply is not None and abs(reply[2]) >= WIN_SCORE:
+                        # already searched to the end of the game
+                        continue
+                    board.make_move(row + 1, col + 1, opponent)
+                    over = board.winner is not None or board.check_draw()
+                    board.undo_move()
+                    if over:
+                        continue
+                    child = [cells_row.copy() for cells_row in position]
+                    child[row][col] = opponent
+                    move = self.minimax(child, depth, player)
+                    if stop.is_set():
+                        # the search was cut short
+                        return
+                    replies[row, col] = (self.reached, move, self.score)
+                # the moves that are worst for player are the likeliest, so they go first
+                cells.sort(key=lambda cell: replies[cell][2] if cell in replies else 0)
+        finally:
+            self.time_budget, self.should_stop = default_budget, default_should_stop
+
+    def pondered_reply(self, cell: tuple[int, int]) -> Optional[tuple[int, int]]:
+        """
+        The reply pondered to the opponent's (0-indexed) (row, col), if it was searched
+        at least self.ponder_depth deep or to the end of the game, or None if it has to
+        be searched.
+        """
+        reply = self.ponder_replies.get(cell)
+        self.ponder_replies = {}
+        empty_cells = self.board.rows * self.board.cols - self.board.moves_played
+        if reply is None or (reply[0] < min(self.ponder_depth, empty_cells) and abs(reply[2]) < WIN_SCORE):
+            return None
+        self.reached, self.score = reply[0], reply[2]
+        if self.collect_stats:
+            self.stats = TicTacToeSearchStats()
+            self.stats.ponder_hit = True
+        return reply[1]
+
+    @profiled
+    def minimax(self, position: List[List[str]], depth: int, max_player: str) -> tuple[int, int]:
+        """
+        Find the best (0-indexed) move for max_player with iterative deepening, searching
+        one move deeper at a time up to depth until self.time_budget seconds have passed.
+        Returns the best move of the deepest search that finished.
+        """
+        start = time.perf_counter()
+        stats = self.stats = TicTacToeSearchStats() if self.collect_stats else None
+        board = MNKBoard(self.board.rows, self.board.cols, self.board.k, position)
+        deadline = None if self.time_budget is None else start + self.time_budget
+        if len(self.memo) > self.max_memo:
+            self.memo.clear()
+
+        helper = self.make_helper(board, deadline, stats)
+        empty_cells = board.rows * board.cols - board.moves_played
+        best_move = board.get_available_moves()[0]
+        self.score = None
+        self.reached = 0
+
+        for current_depth in range(1, min(depth, empty_cells) + 1):
+            try:
+                score, move = helper(current_depth, float("-inf"), float("inf"), max_player)
+            except SearchTimeout:
+                break
+
+            best_move, self.score = move, score
+            self.reached = current_depth
+            if stats is not None:
+                stats.add_iteration(current_depth, helper.node_count(), time.perf_counter() - start)
+            # the game has been searched to the end, searching deeper will not change it
+            if abs(score) >= WIN_SCORE:
+                break
+
+        self.nodes = helper.node_count()
+        if stats is not None:
+            stats.nodes, stats.seconds = self.nodes, time.perf_counter() - start
+        return best_move
+
+    def make_helper(self, board: MNKBoard, deadline: Optional[float] = None, stats: Optional[TicTacToeSearchStats] = None):
+        """
+        Build the negamax alpha-beta search for a position. The returned
+        helper(depth, alpha, beta, player) plays and undoes moves on board and returns
+        (score, move) for player, the one to move. Won positions score WIN_SCORE plus
+        the number of empty cells left, so quicker wins are preferred and the score
+        does not depend on how the position was reached, which lets it be remembered.
+        Every searched position is stored in self.memo with the best move, which is
+        tried first the next time. Raises SearchTimeout once the deadline has passed.
+        If stats is given, the leaf evaluations, memo probes and cutoffs are counted
+        into it.
+        """
+        memo = self.memo
+        probe = memo.get
+        should_stop = self.should_stop
+        evaluate = board.evaluate
+        if stats is not None:
+            evaluate, probe = stats.counting_evaluate(evaluate), stats.counting_probe(probe)
+        cols = board.cols
+        cell_count = board.rows * board.cols
+        # cells on the most lines first, they are the strongest ones
+        order = sorted(range(cell_count), key=lambda cell: -len(board.cell_lines[cell]))
+        cells = [(cell // cols, cell % cols) for cell in order]
+        nodes = 0
+
+        def helper(depth: int, alpha, beta, player: str):
+            nonlocal nodes
+            nodes += 1
+            if not nodes & 255 and ((deadline is not None and time.perf_counter() > deadline) or
+                                    (should_stop is not None and should_stop())):
+                raise SearchTimeout
+
+            empty_cells = cell_count - board.moves_played
+            if board.winner is not None:
+                # the move that got here won the game
+                return -(WIN_SCORE + empty_cells), None
+            if empty_cells == 0:
                 return 0, None
+            if depth == 0:
+                return evaluate(player), None
+
+            key = board.hash ^ SIDE_KEY if player == "O" else board.hash
+            entry = probe(key)
+            memo_move = None
+            if entry is not None:
+                memo_depth, kind, memo_score, memo_move = entry
+                if memo_depth >= depth:
+                    if kind == EXACT:
+                        return memo_score, memo_move
+                    elif kind == LOWER:
+                        alpha = max(alpha, memo_score)
+                    else:
+                        beta = min(beta, memo_score)
+                    if beta <= alpha:
+                        return memo_score, memo_move
+            alpha_start = alpha
+
+            moves = [move for move in cells if board.board[move[0]][move[1]] == "."]
+            if memo_move is not None:
+                moves.remove(memo_move)
+                moves.insert(0, memo_move)
+
+            best_score, best_move = float("-inf"), moves[0]
+            opponent = "X" if player == "O" else "O"
 
-            best_move = random.choice(temp_board.get_available_moves())
+            for row, col in moves:
+                board.make_move(row+1, col+1, player)
+                score = -helper(depth-1, -beta, -alpha, opponent)[0]
+                board.undo_move()
 
-            if max_player == "O":
-                best_score = float("-inf")
+                if score > best_score:
+                    best_score, best_move = score, (row, col)
+                if score > alpha:
+                    alpha = score
+                if beta <= alpha:
+                    break
+
+            if best_score <= alpha_start:
+                kind = UPPER
+            elif best_score >= beta:
+                kind = LOWER
             else:
-                best_score = float("inf")
-            
-            for move in temp_board.get_available_moves():
-                temp_board2 = Board(position)
-                temp_board2.make_move(move[0]+1, move[1]+1, max_player)
-                val = helper(temp_board2.board, depth-1, "X" if max_player == "O" else "O")
-
-                if max_player == "O":
-                    if val[0] > best_score:
-                        best_score = val[0]
-                        best_move = move
-                else:
-                    if val[0] < best_score:
-                        best_score = val[0]
-                        best_move = move
+                kind = EXACT
+            # wins are searched to the end whatever the depth, so they hold at any depth
+            memo[key] = (cell_count if abs(best_score) >= WIN_SCORE and kind == EXACT else depth, kind, best_score, best_move)
 
             return best_score, best_move
-                
-        return helper(position, depth, max_player)[1]
-        
+
+        if stats is not None:
+            # the recursion goes through this wrapper too, so every node that fails high
+            # after searching or looking up moves is counted by its ply
+            search = helper
+            root_moves = board.moves_played
+
+            def helper(depth: int, alpha, beta, player: str):
+                score, move = search(depth, alpha, beta, player)
+                if move is not None and score >= beta:
+                    stats.add_cutoff(board.moves_played - root_moves)
+                return score, move
+
+        def node_count() -> int:
+            return nodes
+
+        helper.node_count = node_count
+        return helper
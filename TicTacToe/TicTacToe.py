@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+import random
 
 class Board:
     """
@@ -18,6 +19,11 @@ class Board:
             ]
         else:
             self.board = [row.copy() for row in board]	
+        self.moves_played = sum(1 for row in self.board for cell in row if cell != ".")
+        self.last_move: Optional[tuple[int, int]] = None
+        # (row, col, winner before the move) of every move made, so moves can be taken back
+        self.history: List[tuple[int, int, Optional[str]]] = []
+        self.winner = self.find_winner()
 
     def display(self) -> str:
         """
@@ -60,14 +66,62 @@ class Board:
         
         if self.board[row][col] == ".":
             self.board[row][col] = player.upper()
+            self.moves_played += 1
+            self.last_move = (row, col)
+            self.history.append((row, col, self.winner))
+            if self.winner is None:
+                self.winner = self.check_win_at(row, col)
             return True
         
         return False
+
+    def undo_move(self) -> Optional[tuple[int, int]]:
+        """
+        Take back the last move made with make_move.
+        Returns the (0-indexed) (row, col) that was cleared, or None if there are no moves to undo.
+        """
+        if not self.history:
+            return None
+
+        row, col, winner = self.history.pop()
+        self.board[row][col] = "."
+        self.moves_played -= 1
+        self.winner = winner
+        self.last_move = self.history[-1][:2] if self.history else None
+        return row, col
     
     def check_win(self) -> Optional[str]:
         """
         Check if there is a winning condition on the board.
         A player wins if they have three of their marks in a row, column, or diagonal.
+        The winner is found as the moves are made, so this does not look at the board.
+        """
+        return self.winner
+
+    def check_win_at(self, row: int, col: int) -> Optional[str]:
+        """
+        Check only the lines through the mark at (row, col), which are its row, its
+        column and the diagonals it lies on. Returns its player if one is complete.
+        """
+        player = self.board[row][col]
+        if player == ".":
+            return None
+
+        if self.board[row][0] == self.board[row][1] == self.board[row][2]:
+            return player
+        if self.board[0][col] == self.board[1][col] == self.board[2][col]:
+            return player
+        if row == col and self.board[0][0] == self.board[1][1] == self.board[2][2]:
+            return player
+        if row + col == 2 and self.board[0][2] == self.board[1][1] == self.board[2][0]:
+            return player
+
+        return None
+
+    def find_winner(self) -> Optional[str]:
+        """
+        Scan the whole board for a complete row, column or diagonal.
+        Returns the player that has one, or None.
         """
         for row in self.board:
             if row[0] != "." and row[0] == row[1] == row[2]:
@@ -89,14 +143,221 @@ class Board:
         Check if the game is a draw.
         A draw occurs when all cells are filled and there is no winner.
         """
-        if self.check_win() is not None:
-            return False
-        
-        for row in self.board:
-            for col in row:
-                if col == ".":
-                    return False
-                
-        return True
+        return self.winner is None and self.moves_played == 9
     
+
+# the lines, the lines through every cell and the hash keys of every board size, built once per size
+_LINE_TABLES: Dict[Tuple[int, int, int], tuple] = {}
+
+
+def line_tables(rows: int, cols: int, k: int) -> tuple:
+    """
+    Build the tables of a rows x cols board where k in a row wins. Cells are numbered
+    row * cols + col. Returns (lines, cell_lines, zobrist): every line of k cells in a
+    row, column or diagonal, the indexes of the lines through each cell, and a random
+    64 bit key for every player and cell to hash positions with.
+    """
+    size = (rows, cols, k)
+    if size not in _LINE_TABLES:
+        lines = []
+        for row in range(rows):
+            for col in range(cols):
+                for row_step, col_step in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_row, end_col = row + row_step * (k - 1), col + col_step * (k - 1)
+                    if 0 <= end_row < rows and 0 <= end_col < cols:
+                        lines.append([(row + row_step * i) * cols + col + col_step * i for i in range(k)])
+
+        cell_lines = [[] for _ in range(rows * cols)]
+        for index, line in enumerate(lines):
+            for cell in line:
+                cell_lines[cell].append(index)
+
+        rng = random.Random(rows * 10000 + cols * 100 + k)
+        zobrist = {player: [rng.getrandbits(64) for _ in range(rows * cols)] for player in ("X", "O")}
+        _LINE_TABLES[size] = (lines, cell_lines, zobrist)
+    return _LINE_TABLES[size]
+
+
+class MNKBoard:
+    """
+    A Tic Tac Toe board of any size, where k marks in a row, column or diagonal win
+    (the m,n,k game). It has the same methods as Board, and also keeps how many marks
+    each player has on every line, which makes finding the winner and evaluating the
+    position a matter of looking at the lines through the last move, and a hash of the
+    position for the search to remember positions by.
+    """
+    def __init__(self, rows: int = 3, cols: int = 3, k: int = 3, board: Optional[List[List[str]]] = None):
+        """
+        Initialize an empty rows x cols board, or a copy of board if it has that size.
+        """
+        self.rows, self.cols, self.k = rows, cols, k
+        self.lines, self.cell_lines, self.zobrist = line_tables(rows, cols, k)
+        self.board = [["."] * cols for _ in range(rows)]
+        # counts[player][line] is how many marks player has on the line
+        self.counts = {"X": [0] * len(self.lines), "O": [0] * len(self.lines)}
+        # the sum of line_value over all lines, for X
+        self.score = 0
+        self.hash = 0
+        self.moves_played = 0
+        self.last_move: Optional[tuple[int, int]] = None
+        self.history: List[tuple[int, int, Optional[str]]] = []
+        self.winner: Optional[str] = None
+
+        if board is not None and len(board) == rows and all(len(row) == cols for row in board):
+            for row in range(rows):
+                for col in range(cols):
+                    if board[row][col] != ".":
+                        self.place(row, col, board[row][col])
+            self.winner = self.find_winner()
+
+    def line_value(self, mine: int, theirs: int) -> int:
+        """
+        How good a line with mine of a player's marks and theirs of the other's is for
+        the player. A line both players have marks on can not be won by either, and
+        every extra mark on an open line is worth four times as much.
+        """
+        if mine and theirs:
+            return 0
+        if mine:
+            return 4 ** mine
+        if theirs:
+            return -4 ** theirs
+        return 0
+
+    def place(self, row: int, col: int, player: str):
+        """
+        Put player's mark on an empty (0-indexed) cell and update the line counts, the
+        score and the hash. This does not check the move or record it in the history.
+        """
+        cell = row * self.cols + col
+        counts_x, counts_o = self.counts["X"], self.counts["O"]
+        counts = counts_x if player == "X" else counts_o
+        for line in self.cell_lines[cell]:
+            before = self.line_value(counts_x[line], counts_o[line])
+            counts[line] += 1
+            self.score += self.line_value(counts_x[line], counts_o[line]) - before
+        self.board[row][col] = player
+        self.hash ^= self.zobrist[player][cell]
+        self.moves_played += 1
+
+    def remove(self, row: int, col: int):
+        """
+        Take the mark off a (0-indexed) cell, undoing place.
+        """
+        player = self.board[row][col]
+        cell = row * self.cols + col
+        counts_x, counts_o = self.counts["X"], self.counts["O"]
+        counts = counts_x if player == "X" else counts_o
+        for line in self.cell_lines[cell]:
+            before = self.line_value(counts_x[line], counts_o[line])
+            counts[line] -= 1
+            self.score += self.line_value(counts_x[line], counts_o[line]) - before
+        self.board[row][col] = "."
+        self.hash ^= self.zobrist[player][cell]
+        self.moves_played -= 1
+
+    def display(self) -> str:
+        """
+        Display the current state of the board in a readable format.
+        Each cell is separated by a pipe (|) and rows are separated by dashes.
+        """
+        display_str = ""
+        for row in self.board:
+            display_str += " | ".join(row) + "\n"
+            display_str += "-" * (4 * self.cols - 3) + "\n"
+        return display_str
+
+    def get_available_moves(self) -> List[tuple[int, int]]:
+        """
+        Get a list of available moves on the board.
+        Each move is represented as a tuple (row, col).
+        """
+        return [(row, col) for row in range(self.rows) for col in range(self.cols) if self.board[row][col] == "."]
+
+    def make_move(self, row: str, col: str, player: str) -> bool:
+        """
+        Make a move on the board for the given player at the specified row and column.
+        The row and column are expected to be 1-indexed.
+        The player should be either "X" or "O".
+        Returns True if the move was successful, False otherwise.
+        """
+        row, col = int(row) - 1, int(col) - 1
+
+        if not (0 <= row < self.rows) or not (0 <= col < self.cols):
+            return False
+        if player.upper() not in ["X", "O"]:
+            return False
+
+        if self.board[row][col] == ".":
+            self.place(row, col, player.upper())
+            self.last_move = (row, col)
+            self.history.append((row, col, self.winner))
+            if self.winner is None:
+                self.winner = self.check_win_at(row, col)
+            return True
+
+        return False
+
+    def undo_move(self) -> Optional[tuple[int, int]]:
+        """
+        Take back the last move made with make_move.
+        Returns the (0-indexed) (row, col) that was cleared, or None if there are no moves to undo.
+        """
+        if not self.history:
+            return None
+
+        row, col, winner = self.history.pop()
+        self.remove(row, col)
+        self.winner = winner
+        self.last_move = self.history[-1][:2] if self.history else None
+        return row, col
+
+    def check_win(self) -> Optional[str]:
+        """
+        Check if a player has k marks in a row, column or diagonal.
+        The winner is found as the moves are made, so this does not look at the board.
+        """
+        return self.winner
+
+    def check_win_at(self, row: int, col: int) -> Optional[str]:
+        """
+        Check only the lines through the mark at (row, col). Returns its player if one
+        of them is complete.
+        """
+        player = self.board[row][col]
+        if player == ".":
+            return None
+
+        counts = self.counts[player]
+        for line in self.cell_lines[row * self.cols + col]:
+            if counts[line] == self.k:
+                return player
+        return None
+
+    def find_winner(self) -> Optional[str]:
+        """
+        Look at every line for one that a player has filled.
+        Returns the player that has one, or None.
+        """
+        for line in range(len(self.lines)):
+            for player in ("X", "O"):
+                if self.counts[player][line] == self.k:
+                    return player
+        return None
+
+    def check_draw(self) -> bool:
+        """
+        Check if the game is a draw.
+        A draw occurs when all cells are filled and there is no winner.
+        """
+        return self.winner is None and self.moves_played == self.rows * self.cols
+
+    def evaluate(self, player: str) -> int:
+        """
+        Score the position for player by how many marks each player has on the lines
+        that are still open to them.
+        """
+        return self.score if player == "X" else -self.score
+
+
 board = Board()
@@ -0,0 +1,56 @@
+import os
+import random
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from GameServer import load_bots
+
+BOTS = load_bots("connect4")
+
+from Solver import Solver
+from TableBase import sample_position
+
+
+def late_positions(count: int = 12, seed: int = 3):
+    """
+    Positions with 8 to 11 empty cells from random games that avoid giving away
+    immediate wins, with the player to move.
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        sampled = sample_position(rng, rng.randint(8, 11))
+        if sampled is not None:
+            positions.append(sampled)
+    return positions
+
+
+def test_weak_solve_matches_strong_solve():
+    for board, player in late_positions():
+        score, _ = Solver().solve(board, player)
+        weak, _ = Solver().solve(board, player, weak=True)
+        assert weak in (-1, 0, 1)
+        assert weak == (score > 0) - (score < 0)
+
+
+def test_solver_matches_full_depth_search():
+    for board, player in late_positions():
+        score, move = Solver().solve(board, player)
+        empty = 42 - board.moves_played()
+
+        bot = BOTS.PlayPro(solver_cells=0)
+        bot.use_book = False
+        bot.tablebase = None
+        bot.minimax(board.to_board(), empty, player)
+        assert bot.score == BOTS.solved_score(score, empty, 0)
+
+        # the solver's move keeps the score
+        board.play(move, player)
+        if board.check_win() == player:
+            assert score == empty
+        elif not board.is_full():
+            reply, _ = Solver().solve(board, 3 - player)
+            assert -reply == score
+        board.undo()